@@ -0,0 +1,70 @@
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, LogitsProcessor, LogitsProcessorList
+from backend.models.quantization import quantization_mode, load_quantized_model
+from backend.models.onnx_backend import inference_backend
+from backend.models.logs import get_logger
+
+
+logger = get_logger("assisted")
+
+# Assisted (speculative) decoding: a small draft model that shares the main model's
+# tokenizer proposes a few tokens, and the main model checks them all in one forward pass
+# and keeps the prefix it agrees with. Greedy output is the same as decoding without the
+# draft; it is just faster when the draft guesses well. transformers only supports it
+# without beam search and for one sequence at a time, and only for PyTorch models.
+def assisted_decoding_available(draft_name_or_path):
+    if not draft_name_or_path:
+        return False
+    if inference_backend() != "torch":
+        logger.warning("Draft model %s ignored: assisted decoding needs INFERENCE_BACKEND=torch", draft_name_or_path)
+        return False
+    return True
+
+# Function to check that a draft model's tokens mean the same as the main model's, since the
+# main model checks the draft's token ids as they are. Raises ValueError when they don't
+def check_draft_tokenizer(name_or_path, main_name_or_path):
+    draft_tokenizer = AutoTokenizer.from_pretrained(name_or_path)
+    main_tokenizer = AutoTokenizer.from_pretrained(main_name_or_path)
+    if (draft_tokenizer.get_vocab() != main_tokenizer.get_vocab() or
+            draft_tokenizer.all_special_ids != main_tokenizer.all_special_ids):
+        raise ValueError(f"Draft model {name_or_path} doesn't share the tokenizer of {main_name_or_path}")
+
+# Function to load a draft model the same way as the main models, int8 included. Its own
+# generation config is made greedy: summarization checkpoints such as distilbart-cnn beam
+# search with length penalties and minimum lengths, which break the draft's short decodes
+def load_draft_model(name_or_path, device="cpu", main_name_or_path=None):
+    if main_name_or_path is not None:
+        check_draft_tokenizer(name_or_path, main_name_or_path)
+    if quantization_mode() == "int8" and device == "cpu":
+        model = load_quantized_model(AutoModelForSeq2SeqLM, name_or_path).eval()
+    else:
+        model = AutoModelForSeq2SeqLM.from_pretrained(name_or_path).to(device).eval()
+    generation_config = model.generation_config
+    generation_config.num_beams = 1
+    generation_config.do_sample = False
+    generation_config.min_length = 0
+    generation_config.length_penalty = 1.0
+    generation_config.no_repeat_ngram_size = 0
+    generation_config.early_stopping = False
+    return model
+
+# Keeps end-of-sequence out until the output is min_length tokens long, like generate's own
+# min_length, which transformers refuses to combine with a draft model. It only looks at
+# the length of each prefix, so it holds when the main model checks several drafted tokens
+class MinLengthProcessor(LogitsProcessor):
+    def __init__(self, min_length, eos_token_id):
+        self.min_length = min_length
+        self.eos_token_id = eos_token_id
+
+    def __call__(self, input_ids, scores):
+        if input_ids.shape[-1] < self.min_length:
+            scores[:, self.eos_token_id] = float("-inf")
+        return scores
+
+# Function to build the generate() options that hand decoding over to a draft model
+def assisted_options(draft_model, min_length=0):
+    options = {"assistant_model": draft_model, "num_beams": 1, "min_length": 0}
+    if min_length > 0:
+        options["logits_processor"] = LogitsProcessorList([
+            MinLengthProcessor(min_length, draft_model.config.eos_token_id)
+        ])
+    return options
@@ -0,0 +1,83 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+# Collects work items submitted from many request threads and hands them to run_batch
+# together. A batch is flushed once it holds max_batch_size rows or once the first item
+# in it has waited max_wait seconds, so a lone request is delayed by at most max_wait.
+# An item that would take a batch past max_batch_size is held back to start the next one;
+# only an item larger than max_batch_size on its own is run as an oversized batch.
+class MicroBatcher:
+    def __init__(self, run_batch, max_batch_size=32, max_wait=0.005, item_size=None, name="batcher"):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.item_size = item_size or (lambda item: 1)
+        self.name = name
+        self._queue = queue.Queue()
+        # Entry held back from the previous batch, only touched by the worker thread
+        self._held = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # Items waiting for the next batch
+    @property
+    def depth(self):
+        return self._queue.qsize() + (self._held is not None)
+
+    def submit(self, item):
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((item, future))
+        return future
+
+    # Blocking helper for callers that just want the result
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        if self._held is not None:
+            batch, self._held = [self._held], None
+        else:
+            batch = [self._queue.get()]
+        rows = self.item_size(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+
+        while rows < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            size = self.item_size(entry[0])
+            if rows + size > self.max_batch_size:
+                self._held = entry
+                break
+            batch.append(entry)
+            rows += size
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.run_batch(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,103 @@
+import os
+import copy
+import bisect
+import threading
+import weakref
+import torch
+import torch.nn.functional as F
+from backend.models.onnx_backend import inference_backend
+from backend.models.logs import get_logger
+
+
+logger = get_logger("compiled")
+
+# Opt-in compiled decoding for the PyTorch backend. With MODEL_COMPILE=1 a model's forward is
+# compiled by torch.compile for fixed shapes, and generate() keeps its key/value cache in
+# static buffers sized to the output length instead of growing them every step. Prompts are
+# padded up to a few batch and length buckets so a handful of graphs cover every request.
+# Compiling a new shape takes seconds to minutes on CPU, so warmup compiles every bucket,
+# and prompts past the largest buckets decode on an uncompiled copy instead of compiling.
+def compile_mode():
+    enabled = os.environ.get("MODEL_COMPILE", "0") == "1"
+    if enabled and inference_backend() != "torch":
+        logger.warning("MODEL_COMPILE ignored: compiled decoding needs INFERENCE_BACKEND=torch")
+        return False
+    return enabled
+
+def parse_buckets(value):
+    return tuple(sorted(int(size) for size in value.split(",") if size.strip()))
+
+batch_buckets = parse_buckets(os.environ.get("COMPILE_BATCH_BUCKETS", "1,8,16,32,64"))
+length_buckets = parse_buckets(os.environ.get("COMPILE_LENGTH_BUCKETS", "128,256,512"))
+
+# Uncompiled copies of compiled models and the lock each compiled model decodes under, keyed
+# by the compiled model. Kept out of the model itself so they don't show up in its state dict
+eager_models = weakref.WeakKeyDictionary()
+decode_locks = weakref.WeakKeyDictionary()
+
+# Function to round a size up to its bucket, sizes past the largest bucket are left as they are
+def bucket(size, buckets):
+    i = bisect.bisect_left(buckets, size)
+    return buckets[i] if i < len(buckets) else size
+
+# Function to compile a model's forward and switch its decodes to a static cache
+def compile_model(model):
+    # Question and answer decodes take four graphs per shape between them (the first step
+    # traces differently from the rest). Past the limit dynamo silently runs eager, so leave room
+    graphs = 8 * len(batch_buckets) * len(length_buckets)
+    torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, graphs)
+    # A shallow copy shares the weights but keeps the original forward and a dynamic cache
+    eager_model = copy.copy(model)
+    eager_model.generation_config = copy.deepcopy(model.generation_config)
+    eager_models[model] = eager_model
+    decode_locks[model] = threading.Lock()
+    model.forward = torch.compile(model.forward, dynamic=False)
+    model.generation_config.cache_implementation = "static"
+    return model
+
+# Function to check whether a (batch, length, ...) prompt tensor fits the largest buckets
+def fits_buckets(tensor):
+    rows, length = tensor.shape[:2]
+    return rows <= batch_buckets[-1] and length <= length_buckets[-1]
+
+# Function to get the uncompiled copy of a compiled model, for prompts that don't fit the
+# buckets: compiling their shape would stall the request for as long as a warmup bucket
+def eager_model(model, tensor):
+    logger.info("Prompt shape %s is past the compiled buckets, decoding without compiling", tuple(tensor.shape[:2]))
+    return eager_models[model]
+
+# Function to run generate() on a compiled model. Its static cache lives on the model and
+# generate() resets it in place, so decodes from different threads (the question and answer
+# batchers, several tiers' workers) take turns on it. Each decode also starts from a fresh
+# cache: generate() reuses its last one when it is big enough, and a reused cache traces
+# differently, so which graph a decode needed would depend on what ran before it
+def compiled_generate(model, **kwargs):
+    with decode_locks[model]:
+        if hasattr(model, "_cache"):
+            del model._cache
+        return model.generate(**kwargs)
+
+# Function to pad a (batch, length, ...) prompt tensor up to its batch and length buckets.
+# Extra rows repeat the first one so they decode like a real prompt, callers drop them after
+def pad_to_buckets(tensor, pad_value=0):
+    rows, length = tensor.shape[:2]
+    padding = bucket(length, length_buckets) - length
+    if padding:
+        tensor = F.pad(tensor, (0, 0) * (tensor.dim() - 2) + (0, padding), value=pad_value)
+    extra_rows = bucket(rows, batch_buckets) - rows
+    if extra_rows:
+        tensor = torch.cat([tensor, tensor[:1].expand(extra_rows, *tensor.shape[1:])])
+    return tensor
+
+# Function to compile every batch and length bucket ahead of the first request. Each decode
+# is called as decode(input_ids, attention_mask) and must go through compiled_generate
+def warmup_buckets(tokenizer, decodes, device="cpu"):
+    prompt = tokenizer("Generate a single question from the following text: Water evaporates.",
+                       return_tensors="pt").input_ids.to(device)
+    for length in length_buckets:
+        input_ids = F.pad(prompt, (0, length - prompt.shape[1]), value=tokenizer.pad_token_id)
+        attention_mask = (input_ids != tokenizer.pad_token_id).long()
+        for rows in batch_buckets:
+            for decode in decodes:
+                with torch.no_grad():
+                    decode(input_ids.repeat(rows, 1), attention_mask.repeat(rows, 1))
@@ -0,0 +1,116 @@
+import functools
+import torch
+from transformers import LogitsProcessor
+
+
+# Function to look up, once per tokenizer, the token ids the MCQ format is built from
+@functools.lru_cache(maxsize=None)
+def format_token_ids(tokenizer):
+    separator = tokenizer("|||", add_special_tokens=False).input_ids
+    vocab = tokenizer.get_vocab()
+    # Pieces with a pipe in them may only appear as part of a separator
+    pipes = sorted(i for piece, i in vocab.items() if "|" in piece)
+    # Pieces that are only whitespace don't count towards a field's length
+    blanks = sorted(i for piece, i in vocab.items() if not piece.replace("▁", "").strip())
+    return separator, pipes, blanks
+
+
+# Forces decodes into "question ||| answer ||| distractor ||| distractor ||| distractor".
+# Each row is tracked as a small state machine: which field it is in, how many tokens the
+# field has and how far into a separator it is. Per step, pipes are only allowed as the
+# start of a separator once the field has some text, the rest of a separator is forced,
+# end-of-sequence is only allowed in the last field, and a field that hits its length
+# limit is closed. State is updated from the last token only, so a step costs a few
+# vectorised tensor ops whatever the batch size. Build a new one for every generate call.
+class MCQFormatLogitsProcessor(LogitsProcessor):
+    def __init__(self, tokenizer, num_fields=5, max_question_tokens=32, max_field_tokens=10):
+        separator, pipes, blanks = format_token_ids(tokenizer)
+        self.separator = separator
+        self.pipes = pipes
+        self.blanks = blanks
+        self.eos_token_id = tokenizer.eos_token_id
+        self.num_fields = num_fields
+        self.max_question_tokens = max_question_tokens
+        self.max_field_tokens = max_field_tokens
+        self._state = None
+
+    # Longest possible output, not counting the decoder start token
+    @property
+    def max_length(self):
+        fields = self.max_question_tokens + (self.num_fields - 1) * self.max_field_tokens
+        return fields + (self.num_fields - 1) * len(self.separator) + 1
+
+    def _init_state(self, batch_size, vocab_size, device):
+        zeros = lambda: torch.zeros(batch_size, dtype=torch.long, device=device)
+        self._state = {
+            "fields_done": zeros(),
+            "field_length": zeros(),
+            "separator_progress": zeros(),
+            "finished": torch.zeros(batch_size, dtype=torch.bool, device=device)
+        }
+        self._separator = torch.tensor(self.separator, device=device)
+        self._is_blank = torch.zeros(vocab_size, dtype=torch.bool, device=device)
+        self._is_blank[[i for i in self.blanks if i < vocab_size]] = True
+
+    def _update(self, tokens):
+        state = self._state
+        active = ~state["finished"]
+        in_separator = active & (state["separator_progress"] > 0)
+
+        # Continue a separator already started, closing the field once it is complete
+        state["separator_progress"][in_separator] += 1
+        closed = in_separator & (state["separator_progress"] >= len(self.separator))
+
+        starts = active & ~in_separator & (tokens == self.separator[0])
+        if len(self.separator) == 1:
+            closed |= starts
+        else:
+            state["separator_progress"][starts] = 1
+
+        state["fields_done"][closed] += 1
+        state["field_length"][closed] = 0
+        state["separator_progress"][closed] = 0
+        state["finished"] |= active & ~in_separator & (tokens == self.eos_token_id)
+
+        in_field = active & ~in_separator & ~starts & (tokens != self.eos_token_id)
+        state["field_length"][in_field & ~self._is_blank[tokens]] += 1
+
+    def __call__(self, input_ids, scores):
+        if self._state is None:
+            self._init_state(input_ids.shape[0], scores.shape[-1], input_ids.device)
+        else:
+            self._update(input_ids[:, -1])
+        state = self._state
+
+        separator_start = self.separator[0]
+        separator_scores = scores[:, separator_start].clone()
+        eos_scores = scores[:, self.eos_token_id].clone()
+        scores[:, self.pipes] = float("-inf")
+        scores[:, self.eos_token_id] = float("-inf")
+
+        last_field = state["fields_done"] >= self.num_fields - 1
+        has_text = state["field_length"] > 0
+        limit = torch.where(state["fields_done"] == 0, self.max_question_tokens, self.max_field_tokens)
+        in_separator = state["separator_progress"] > 0
+
+        allow_separator = ~last_field & has_text & ~in_separator
+        scores[allow_separator, separator_start] = separator_scores[allow_separator]
+        allow_eos = last_field & has_text
+        scores[allow_eos, self.eos_token_id] = eos_scores[allow_eos]
+
+        # Rows with exactly one legal token: mid-separator, or a field at its length limit.
+        # Rows that sampling filters left with nothing legal are closed the same way, and
+        # finished rows only need some finite score since generate pads them anyway
+        dead = torch.isinf(scores).all(dim=-1)
+        forced = torch.full_like(state["fields_done"], -1)
+        close_field = (~in_separator & (state["field_length"] >= limit)) | dead
+        forced[close_field & ~last_field] = separator_start
+        forced[close_field & last_field] = self.eos_token_id
+        forced[in_separator] = self._separator[state["separator_progress"][in_separator]]
+        forced[state["finished"] & ~dead] = -1
+
+        rows = (forced >= 0).nonzero(as_tuple=True)[0]
+        if len(rows):
+            scores[rows] = float("-inf")
+            scores[rows, forced[rows]] = 0
+        return scores
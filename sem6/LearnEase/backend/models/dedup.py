@@ -0,0 +1,110 @@
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from backend.models.near_duplicates import NearDuplicateIndex
+
+
+# Function to turn an answer into a tuple of lowercase words for containment checks
+def answer_words(answer):
+    return tuple(re.findall(r"\w+", answer.lower()))
+
+# Function to list every contiguous run of words in an answer
+def word_ngrams(words):
+    return [words[start:end] for start in range(len(words)) for end in range(start + 1, len(words) + 1)]
+
+
+# Questions and answers already used within one request, session or document. Both are
+# bounded LRU sets; answers are also indexed by their word n-grams so "is this answer
+# contained in, or does it contain, an earlier one" is a few hash lookups, not a scan.
+# MinHash indexes on top catch rewordings that exact matching lets through.
+class DedupScope:
+    def __init__(self, max_items=500, question_similarity=0.8, answer_similarity=0.8):
+        self.max_items = max_items
+        self._questions = OrderedDict()
+        self._answers = OrderedDict()
+        self._answer_ngrams = Counter()
+        self._similar_questions = NearDuplicateIndex(threshold=question_similarity)
+        self._similar_answers = NearDuplicateIndex(threshold=answer_similarity)
+        self._lock = threading.Lock()
+
+    def has_question(self, question):
+        with self._lock:
+            return self._has_question(question.lower())
+
+    def _has_question(self, question):
+        return question in self._questions or self._similar_questions.find(question) is not None
+
+    def answer_conflicts(self, answer):
+        with self._lock:
+            return self._answer_conflicts(answer_words(answer))
+
+    def _answer_conflicts(self, words):
+        if not words:
+            return False
+        # The new answer sits inside an earlier one
+        if self._answer_ngrams[words] > 0:
+            return True
+        # An earlier answer sits inside the new one
+        if any(ngram in self._answers for ngram in word_ngrams(words)):
+            return True
+        return self._similar_answers.find(" ".join(words)) is not None
+
+    # Records a question/answer pair, returns False if another request got there first
+    def add(self, question, answer):
+        question = question.lower()
+        words = answer_words(answer)
+        with self._lock:
+            if self._has_question(question) or self._answer_conflicts(words):
+                return False
+
+            self._questions[question] = None
+            self._similar_questions.add(question, question)
+            if len(self._questions) > self.max_items:
+                evicted, _ = self._questions.popitem(last=False)
+                self._similar_questions.remove(evicted)
+
+            if words:
+                self._answers[words] = None
+                self._answer_ngrams.update(word_ngrams(words))
+                self._similar_answers.add(words, " ".join(words))
+                if len(self._answers) > self.max_items:
+                    evicted, _ = self._answers.popitem(last=False)
+                    self._similar_answers.remove(evicted)
+                    self._answer_ngrams.subtract(word_ngrams(evicted))
+                    for ngram in word_ngrams(evicted):
+                        if self._answer_ngrams[ngram] <= 0:
+                            del self._answer_ngrams[ngram]
+            return True
+
+
+# Hands out a DedupScope per scope id. Scopes unused for ttl seconds are dropped, and
+# at most max_scopes are kept, so state no longer grows for the life of the process.
+class DedupStore:
+    def __init__(self, max_scopes=1024, ttl=3600, max_items=500):
+        self.max_scopes = max_scopes
+        self.ttl = ttl
+        self.max_items = max_items
+        self._scopes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._scopes)
+
+    def scope(self, scope_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._scopes.pop(scope_id, None)
+            if entry is not None and now - entry[0] > self.ttl:
+                entry = None
+
+            # Least recently used scopes sit at the front, so expired ones come off first
+            while self._scopes:
+                oldest_id, (last_used, _) = next(iter(self._scopes.items()))
+                if now - last_used <= self.ttl and len(self._scopes) < self.max_scopes:
+                    break
+                del self._scopes[oldest_id]
+
+            scope = entry[1] if entry is not None else DedupScope(self.max_items)
+            self._scopes[scope_id] = (now, scope)
+            return scope
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Raised when every worker is busy and the wait queue is full
+class PoolFullError(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Inference queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+# A pool slot held for a whole stream and released exactly once. A stream that never
+# started is released by the response's background task, one that started by iterate
+class PoolSlot:
+    def __init__(self, pool):
+        self._pool = pool
+        self._released = False
+        self._lock = threading.Lock()
+        self.started = False
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._pool.release()
+
+    def release_unstarted(self):
+        if not self.started:
+            self.release()
+
+
+# Runs blocking model work on a small thread pool, so the event loop stays free for
+# cheap requests. Threads are enough here because torch releases the GIL during
+# inference and the models are loaded once per process. Most of a worker's time is spent
+# waiting on the summary and MCQ batchers, so several workers are needed for concurrent
+# requests to share a batch at all.
+class InferencePool:
+    def __init__(self, max_workers=1, max_queue=8, retry_after=10):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    # Jobs running or waiting for a worker
+    @property
+    def depth(self):
+        return self._pending
+
+    def acquire(self):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                raise PoolFullError(self.retry_after)
+            self._pending += 1
+
+    def release(self):
+        with self._lock:
+            self._pending -= 1
+
+    # Function to acquire a slot for a stream, so a full queue is reported before it starts
+    def hold(self):
+        self.acquire()
+        return PoolSlot(self)
+
+    async def run(self, func, *args, **kwargs):
+        self.acquire()
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+        except BaseException:
+            self.release()
+            raise
+        # Release on completion, not on await, so a disconnected client can't free a slot early
+        future.add_done_callback(lambda _: self.release())
+        return await asyncio.wrap_future(future)
+
+    # Pulls each item of a blocking iterator on the pool, in the slot the caller got from hold()
+    async def iterate(self, iterator, slot):
+        sentinel = object()
+        slot.started = True
+        future = None
+        try:
+            while True:
+                future = self._executor.submit(next, iterator, sentinel)
+                item = await asyncio.wrap_future(future)
+                if item is sentinel:
+                    break
+                yield item
+        finally:
+            # A cancelled stream leaves its last next() running, the slot is freed once it returns
+            if future is None:
+                slot.release()
+            else:
+                future.add_done_callback(lambda _: slot.release())
+
+
+inference_pool = InferencePool(
+    max_workers=int(os.environ.get("INFERENCE_WORKERS", "4")),
+    max_queue=int(os.environ.get("INFERENCE_QUEUE_DEPTH", "8")),
+    retry_after=int(os.environ.get("INFERENCE_RETRY_AFTER", "10"))
+)
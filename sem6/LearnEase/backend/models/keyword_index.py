@@ -0,0 +1,81 @@
+from collections import deque
+
+
+# Aho-Corasick matcher over a fixed set of keywords. It is built once and then finds
+# every keyword occurring in a text in a single pass over that text.
+class KeywordIndex:
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._keywords = {}
+        self._whole_word_only = {}
+        self._case_sensitive = {}
+
+        for keyword in keywords:
+            pattern = keyword.lower()
+            if not pattern or pattern in self._keywords:
+                continue
+            self._keywords[pattern] = keyword
+            # Acronyms and proper nouns ("UN", "WHO") would otherwise match inside ordinary words
+            self._whole_word_only[pattern] = keyword != pattern
+            # and acronyms must keep their case, or "who" and "un" in plain answers pick them
+            self._case_sensitive[pattern] = keyword.isupper()
+
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                node = next_node
+            self._output[node].append(pattern)
+
+        # Breadth-first pass to link every node to its longest proper suffix in the trie
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def __len__(self):
+        return len(self._keywords)
+
+    # Returns (keyword, start, whole_word) for every keyword found in the text
+    def find_all(self, text):
+        original = text
+        text = text.lower()
+        matches = []
+        node = 0
+        for end, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+
+            for pattern in self._output[node]:
+                start = end - len(pattern) + 1
+                whole_word = ((start == 0 or not text[start - 1].isalnum()) and
+                              (end + 1 == len(text) or not text[end + 1].isalnum()))
+                if self._case_sensitive[pattern] and original[start:end + 1] != self._keywords[pattern]:
+                    continue
+                if whole_word or not self._whole_word_only[pattern]:
+                    matches.append((self._keywords[pattern], start, whole_word))
+        return matches
+
+    # Picks the best keyword in the text: whole-word matches first, then the longest, then the earliest
+    def best_match(self, text):
+        best = None
+        best_score = None
+        for keyword, start, whole_word in self.find_all(text):
+            score = (whole_word, len(keyword), -start)
+            if best_score is None or score > best_score:
+                best, best_score = keyword, score
+        return best
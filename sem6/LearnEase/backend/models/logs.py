@@ -0,0 +1,30 @@
+import logging
+import os
+import random
+
+
+# Leveled logging for the backend, configured from the environment. Warnings and errors are
+# always written; routine per-request lines can be sampled down with LOG_SAMPLE_RATE so busy
+# servers don't spend their time on log I/O.
+log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+log_sample_rate = float(os.environ.get("LOG_SAMPLE_RATE", "1"))
+
+class SampleFilter(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+_root_logger = logging.getLogger("learnease")
+if not _root_logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    _handler.addFilter(SampleFilter(log_sample_rate))
+    _root_logger.addHandler(_handler)
+    _root_logger.setLevel(log_level)
+    _root_logger.propagate = False
+
+def get_logger(name):
+    return _root_logger.getChild(name)
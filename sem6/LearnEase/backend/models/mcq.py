@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+
+
+# One generated multiple-choice question. The API serialises these directly with to_dict;
+# to_text renders the older "Question:/A)/Correct Answer:" layout for anything that still
+# wants plain text.
+@dataclass(slots=True)
+class MCQ:
+    question: str
+    options: list
+    correct_index: int
+
+    @property
+    def correct_answer(self):
+        return self.options[self.correct_index]
+
+    def to_dict(self):
+        return {
+            "question": self.question,
+            "options": list(self.options),
+            "correct_answer": self.correct_answer,
+            "correct_index": self.correct_index
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["question"], list(data["options"]), data["correct_index"])
+
+    def to_text(self):
+        mcq = f"Question: {self.question}\n\n"
+        for letter, option in zip("ABCD", self.options):
+            mcq += f"{letter}) {option}\n"
+        mcq += f"\nCorrect Answer: {chr(65 + self.correct_index)}) {self.correct_answer}"
+        return mcq
@@ -0,0 +1,50 @@
+import hashlib
+import random
+import threading
+from collections import OrderedDict
+
+
+# Keeps every valid MCQ generated for a paragraph, keyed by the paragraph's hash, so a
+# repeat quiz on the same material is served from the pool and only the shortfall is
+# generated. The least recently quizzed paragraphs are dropped past max_paragraphs.
+class MCQPool:
+    def __init__(self, max_paragraphs=256, max_per_paragraph=50):
+        self.max_paragraphs = max_paragraphs
+        self.max_per_paragraph = max_per_paragraph
+        self._pools = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(paragraph, model=""):
+        normalized = " ".join(paragraph.split()).lower()
+        return hashlib.sha256(f"{model}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def size(self, key):
+        with self._lock:
+            return len(self._pools.get(key, ()))
+
+    def add(self, key, mcqs):
+        with self._lock:
+            pool = self._pools.setdefault(key, {})
+            self._pools.move_to_end(key)
+            for mcq in mcqs:
+                if len(pool) >= self.max_per_paragraph:
+                    break
+                pool.setdefault(mcq["question"].lower(), mcq)
+            while len(self._pools) > self.max_paragraphs:
+                self._pools.popitem(last=False)
+
+    # Returns every MCQ pooled for a paragraph
+    def mcqs(self, key):
+        with self._lock:
+            return list(self._pools.get(key, {}).values())
+
+    # Returns up to count MCQs from the pool in random order
+    def sample(self, key, count):
+        with self._lock:
+            pool = self._pools.get(key)
+            if not pool:
+                return []
+            self._pools.move_to_end(key)
+            mcqs = list(pool.values())
+        return random.sample(mcqs, min(count, len(mcqs)))
@@ -0,0 +1,32 @@
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+
+# Prometheus metrics served on /metrics. Every pipeline stage is timed into one histogram
+# labelled by stage; buckets span sub-millisecond parsing up to minute-long summaries.
+stage_seconds = Histogram(
+    "learnease_stage_seconds", "Time spent in each pipeline stage", ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+queue_depth = Gauge("learnease_queue_depth", "Jobs waiting or running in each queue", ["queue"])
+chunks_summarized = Counter("learnease_chunks_summarized_total", "Chunks summarized")
+mcqs_raw = Counter("learnease_mcqs_raw_total", "Candidate questions sampled for MCQs")
+mcqs_valid = Counter("learnease_mcqs_valid_total", "MCQs produced from the sampled candidates")
+
+metrics_content_type = CONTENT_TYPE_LATEST
+
+@contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.labels(stage).observe(time.perf_counter() - started)
+
+# Function to report a queue's depth, read from depth() whenever /metrics is scraped
+def track_queue(name, depth):
+    queue_depth.labels(name).set_function(depth)
+
+def render_metrics():
+    return generate_latest()
@@ -0,0 +1,85 @@
+import hashlib
+import re
+import numpy as np
+
+
+# Function to break text into word shingles (runs of `size` normalized words). Word runs keep
+# word order and a swapped noun changes every run it is in, so "main source of energy" and
+# "main source of water" stay apart while case, punctuation and spacing changes still match
+def shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+# MinHash signatures bucketed with LSH banding: a lookup only compares against entries that
+# share at least one band, then confirms with the estimated Jaccard similarity.
+# With 32 bands of 4 rows, pairs above ~0.6 similarity are found with high probability.
+class NearDuplicateIndex:
+    _prime = (1 << 31) - 1
+
+    def __init__(self, threshold=0.6, num_perm=128, bands=32, seed=7):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, self._prime, size=num_perm, dtype=np.int64)
+        self._b = rng.integers(0, self._prime, size=num_perm, dtype=np.int64)
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def signature(self, text):
+        values = shingles(text)
+        if not values:
+            return None
+        # Keep the base hashes below the prime so a * hash + b can't overflow int64
+        hashes = np.fromiter((int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+                              % self._prime for value in values),
+                             dtype=np.int64, count=len(values))
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % self._prime).min(axis=1)
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    # Returns the key of a stored entry similar to the text, or None
+    def find(self, text, signature=None):
+        signature = self.signature(text) if signature is None else signature
+        if signature is None:
+            return None
+
+        checked = set()
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            for key in bucket.get(band_key, ()):
+                if key in checked:
+                    continue
+                checked.add(key)
+                if np.mean(self._signatures[key] == signature) >= self.threshold:
+                    return key
+        return None
+
+    def add(self, key, text):
+        signature = self.signature(text)
+        if signature is None:
+            return
+        self.remove(key)
+        self._signatures[key] = signature
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(band_key, set()).add(key)
+
+    def remove(self, key):
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            keys = bucket.get(band_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del bucket[band_key]
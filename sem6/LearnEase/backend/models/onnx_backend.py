@@ -0,0 +1,67 @@
+import os
+import shutil
+from backend.models.quantization import checkpoint_fingerprint, quantization_mode
+
+
+# Optional ONNX Runtime backend: seq2seq models are exported once to ONNX (encoder, decoder and
+# decoder with past key-values) and run by ORT, which fuses the graph and has far less per-call
+# overhead than eager PyTorch for short decodes. optimum is only imported when this is selected.
+onnx_cache_dir = os.environ.get(
+    "ONNX_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "onnx_cache")
+)
+onnx_threads = int(os.environ.get("ONNX_THREADS", "0"))
+
+def inference_backend():
+    return os.environ.get("INFERENCE_BACKEND", "torch").strip().lower()
+
+# Function to name the export directory of a checkpoint, int8 graphs are kept apart from fp32 ones
+def onnx_export_dir(name_or_path, quantize=False, cache_dir=None):
+    cache_dir = cache_dir or onnx_cache_dir
+    variant = "onnx-int8" if quantize else "onnx"
+    safe_name = os.path.basename(os.path.normpath(name_or_path)).replace("/", "_")
+    return os.path.join(cache_dir, f"{safe_name}-{variant}-{checkpoint_fingerprint(name_or_path)}")
+
+# Function to quantize every exported graph in place with ORT's dynamic int8 quantization
+def quantize_onnx_dir(export_dir):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    for file_name in os.listdir(export_dir):
+        if file_name.endswith(".onnx"):
+            file_path = os.path.join(export_dir, file_name)
+            quantize_dynamic(file_path, f"{file_path}.int8", weight_type=QuantType.QInt8)
+            os.replace(f"{file_path}.int8", file_path)
+
+# Function to load a seq2seq model on ONNX Runtime, exporting it on the first start
+def load_onnx_model(name_or_path, device="cpu", cache_dir=None):
+    try:
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError as e:
+        raise ImportError('INFERENCE_BACKEND=onnx needs optimum with ONNX Runtime: pip install "optimum[onnxruntime]"') from e
+
+    session_options = onnxruntime.SessionOptions()
+    session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if onnx_threads > 0:
+        session_options.intra_op_num_threads = onnx_threads
+    provider = "CUDAExecutionProvider" if device == "cuda" else "CPUExecutionProvider"
+
+    # int8 dynamic quantization only applies to CPU inference
+    quantize = quantization_mode() == "int8" and device == "cpu"
+    export_dir = onnx_export_dir(name_or_path, quantize, cache_dir)
+    if not os.path.isdir(export_dir):
+        # Export into a temporary directory and rename it, so a crash never leaves half an export
+        temp_dir = f"{export_dir}.{os.getpid()}.tmp"
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        ORTModelForSeq2SeqLM.from_pretrained(name_or_path, export=True, use_cache=True).save_pretrained(temp_dir)
+        if quantize:
+            quantize_onnx_dir(temp_dir)
+        try:
+            os.replace(temp_dir, export_dir)
+        except OSError:
+            # Another worker finished the same export first
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return ORTModelForSeq2SeqLM.from_pretrained(
+        export_dir, use_cache=True, provider=provider, session_options=session_options
+    )
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import fitz
+
+
+# Big PDFs are split into page ranges that worker processes extract in parallel. Workers are
+# spawned, not forked: the server is multithreaded (torch, batchers, the inference pool) and a
+# forked child can deadlock on a lock held at fork time. This module only imports fitz, so
+# spawned workers start quickly.
+parallel_min_pages = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "64"))
+extraction_workers = int(os.environ.get("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+
+def get_extraction_pool():
+    global _extraction_pool
+    if _extraction_pool is None:
+        with _extraction_pool_lock:
+            if _extraction_pool is None:
+                _extraction_pool = ProcessPoolExecutor(max_workers=extraction_workers,
+                                                       mp_context=multiprocessing.get_context("spawn"))
+    return _extraction_pool
+
+# Function to open a PDF from a path, or straight from the uploaded bytes without a temp file
+def open_pdf(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+# Function to extract the text of pages [start, stop), also what each worker process runs
+def extract_page_range(source, start, stop):
+    with open_pdf(source) as doc:
+        return [doc.load_page(page_num).get_text("text") for page_num in range(start, stop)]
+
+# Function to extract the text of each page separately, so chunks can be traced back to pages
+def extract_pdf_pages(source):
+    with open_pdf(source) as doc:
+        page_count = doc.page_count
+        if page_count < parallel_min_pages or extraction_workers <= 1:
+            return [doc.load_page(page_num).get_text("text") for page_num in range(page_count)]
+
+    # Uploaded bytes are written to one temp file that every worker opens, instead of being
+    # pickled through the pipe to each of them
+    spooled = None
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as spool:
+            spool.write(source)
+        source = spooled = spool.name
+    try:
+        pages_per_worker = -(-page_count // extraction_workers)
+        pool = get_extraction_pool()
+        futures = [
+            pool.submit(extract_page_range, source, start, min(start + pages_per_worker, page_count))
+            for start in range(0, page_count, pages_per_worker)
+        ]
+
+        pages = []
+        for future in futures:
+            pages.extend(future.result())
+        return pages
+    finally:
+        if spooled is not None:
+            os.remove(spooled)
+
+def extract_pdf_text(source):
+    return "".join(extract_pdf_pages(source))
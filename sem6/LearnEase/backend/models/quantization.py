@@ -0,0 +1,81 @@
+import contextlib
+import hashlib
+import os
+import torch
+from transformers import AutoConfig, GenerationConfig
+from backend.models.logs import get_logger
+
+
+logger = get_logger("quantization")
+
+# Opt-in int8 dynamic quantization for CPU inference: nn.Linear weights are stored as int8
+# and activations are quantized on the fly. Quantized weights are cached on disk so later
+# starts skip loading the fp32 checkpoint altogether.
+quantized_cache_dir = os.environ.get(
+    "QUANTIZED_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "quantized_cache")
+)
+
+def quantization_mode():
+    return os.environ.get("MODEL_QUANTIZE", "").strip().lower()
+
+def quantize_int8(model):
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+# Function to fingerprint a checkpoint, changing whenever its weight files or the torch version do
+def checkpoint_fingerprint(name_or_path):
+    fingerprint = name_or_path
+    if os.path.isdir(name_or_path):
+        fingerprint = os.path.abspath(name_or_path)
+        for file_name in sorted(os.listdir(name_or_path)):
+            if file_name.endswith((".safetensors", ".bin")):
+                stat = os.stat(os.path.join(name_or_path, file_name))
+                fingerprint += f"|{file_name}:{stat.st_size}:{int(stat.st_mtime)}"
+    fingerprint += f"|torch {torch.__version__}"
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+
+# Function to skip random weight init for a skeleton the cache will overwrite. Imported here
+# because the helper is internal to transformers and moves between releases; without it
+# the skeleton is just initialised for nothing
+def no_weight_init():
+    try:
+        from transformers.modeling_utils import no_init_weights
+    except ImportError:
+        return contextlib.nullcontext()
+    return no_init_weights()
+
+# Function to name the cache file of a checkpoint's quantized weights
+def quantized_cache_path(name_or_path, cache_dir=None):
+    cache_dir = cache_dir or quantized_cache_dir
+    digest = checkpoint_fingerprint(name_or_path)
+    safe_name = os.path.basename(os.path.normpath(name_or_path)).replace("/", "_")
+    return os.path.join(cache_dir, f"{safe_name}-int8-{digest}.pt")
+
+# Function to load a seq2seq model with int8 linear layers, from the disk cache when possible
+def load_quantized_model(model_class, name_or_path, cache_dir=None):
+    cache_path = quantized_cache_path(name_or_path, cache_dir)
+
+    if os.path.exists(cache_path):
+        # Build an uninitialised skeleton with the same quantized layout, then fill it from the cache
+        config = AutoConfig.from_pretrained(name_or_path)
+        with no_weight_init():
+            # Auto classes can't be instantiated directly, concrete model classes can
+            model = model_class.from_config(config) if hasattr(model_class, "from_config") else model_class(config)
+        model = quantize_int8(model.eval())
+        model.load_state_dict(torch.load(cache_path, map_location="cpu", weights_only=False))
+        # from_config doesn't read generation_config.json (beam count, length penalty, ...)
+        try:
+            model.generation_config = GenerationConfig.from_pretrained(name_or_path)
+        except OSError:
+            model.generation_config = GenerationConfig.from_model_config(config)
+        return model
+
+    model = quantize_int8(model_class.from_pretrained(name_or_path).eval())
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        torch.save(model.state_dict(), temp_path)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        logger.warning("Error caching quantized weights for %s: %s", name_or_path, e)
+    return model
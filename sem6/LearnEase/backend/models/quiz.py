@@ -1,15 +1,76 @@
 import torch
-from transformers import T5Tokenizer, T5ForConditionalGeneration
+import torch.nn.functional as F
+from transformers import T5Tokenizer, T5ForConditionalGeneration, LogitsProcessorList
+from transformers.modeling_outputs import BaseModelOutput
 import re
 import random
 import os
-
-
-# Load the fine-tuned model
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model_path = "C:\\MProj\\LearnEase_New\\backend\\mcq_t5_finetuned1"  # Update with your model path
-model = T5ForConditionalGeneration.from_pretrained(model_path).to(device)
-tokenizer = T5Tokenizer.from_pretrained(model_path)
+import functools
+from backend.models.keyword_index import KeywordIndex
+from backend.models.registry import registry, model_device
+from backend.models.batching import MicroBatcher
+from backend.models.dedup import DedupScope
+from backend.models.mcq import MCQ
+from backend.models.constrained import MCQFormatLogitsProcessor
+from backend.models.quantization import quantization_mode, load_quantized_model
+from backend.models.onnx_backend import inference_backend, load_onnx_model
+from backend.models.compiled import compile_mode, compile_model, fits_buckets, eager_model, pad_to_buckets, compiled_generate, warmup_buckets
+from backend.models.tiers import registry_name
+from backend.models.metrics import timed, track_queue, mcqs_raw, mcqs_valid
+from backend.models.logs import get_logger
+
+
+logger = get_logger("quiz")
+
+# The fine-tuned model is loaded through the registry, on first use or at startup
+device = model_device()
+model_path = os.environ.get(
+    "MCQ_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcq_t5_finetuned1")
+)
+# The fast tier is a smaller T5 kept next to the fine-tuned one, used when it is present
+fast_model_path = os.environ.get(
+    "MCQ_FAST_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcq_t5_small")
+)
+model_paths = {"quality": model_path}
+if "MCQ_FAST_MODEL_PATH" in os.environ or os.path.isdir(fast_model_path):
+    model_paths["fast"] = fast_model_path
+mcq_compiled = compile_mode()
+
+# Function to load the fine-tuned T5 model and its tokenizer
+def load_mcq_model(path=model_path):
+    if inference_backend() == "onnx":
+        model = load_onnx_model(path, device)
+    elif quantization_mode() == "int8" and device == "cpu":
+        model = load_quantized_model(T5ForConditionalGeneration, path).eval()
+    else:
+        model = T5ForConditionalGeneration.from_pretrained(path).to(device).eval()
+    if mcq_compiled:
+        model = compile_model(model)
+    tokenizer = T5Tokenizer.from_pretrained(path)
+    return model, tokenizer
+
+# Function to run one short decode so the first real request doesn't pay for lazy initialisation.
+# A compiled model instead runs question and answer decodes at every shape bucket
+def warmup_mcq_model(loaded):
+    model, tokenizer = loaded
+    if mcq_compiled:
+        encode = lambda input_ids, attention_mask: model.get_encoder()(
+            input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+        warmup_buckets(tokenizer, [
+            lambda input_ids, attention_mask: sample_questions(
+                model, tokenizer, encode(input_ids, attention_mask), attention_mask),
+            functools.partial(sample_answers, model, tokenizer)
+        ], device)
+        return
+    input_ids = tokenizer("Generate a single question from the following text: Water evaporates.",
+                          return_tensors="pt").input_ids.to(device)
+    with torch.no_grad():
+        model.generate(input_ids, max_length=8)
+
+for tier, path in model_paths.items():
+    registry.register(registry_name("mcq", tier), functools.partial(load_mcq_model, path), warmup_mcq_model)
 
 # Function to clean text and extract key phrases
 def extract_key_answer(text):
@@ -59,18 +120,150 @@ def extract_key_answer(text):
 
     return text
 
-# Function to generate a question
-def generate_question(text):
-    input_text = f"Generate a single question from the following text: {text}"
-    input_ids = tokenizer(input_text, return_tensors="pt").input_ids.to(device)
+# Function to run the T5 encoder over a prompt once and reuse it for every later decode
+def encode_prompt(input_text, encoder_cache=None, tier="quality"):
+    if encoder_cache is not None and input_text in encoder_cache:
+        return encoder_cache[input_text]
+
+    model, tokenizer = registry.get(registry_name("mcq", tier))
+    inputs = tokenizer(input_text, return_tensors="pt").to(device)
+    with torch.no_grad():
+        encoder_outputs = model.get_encoder()(
+            input_ids=inputs.input_ids,
+            attention_mask=inputs.attention_mask
+        )
+    encoded = (encoder_outputs.last_hidden_state, inputs.attention_mask)
+    if encoder_cache is not None:
+        encoder_cache[input_text] = encoded
+    return encoded
+
+# With MCQ_CONSTRAINED_DECODING=1 question decodes are forced into the
+# "question ||| answer ||| distractor ||| distractor ||| distractor" layout, so the answer
+# and distractors come out of the same decode instead of a second answer pass
+mcq_constrained_decoding = os.environ.get("MCQ_CONSTRAINED_DECODING", "0") == "1"
+
+# Function to build the generate() options shared by every question decode
+def question_generation_options(tokenizer):
+    options = {"do_sample": True, "temperature": 0.7, "max_length": 50}
+    if mcq_constrained_decoding:
+        format_processor = MCQFormatLogitsProcessor(tokenizer)
+        options["max_length"] = format_processor.max_length + 1
+        options["logits_processor"] = LogitsProcessorList([format_processor])
+    return options
+
+# Function to sample questions from encoded prompts. On a compiled model the prompts are
+# padded to the shape buckets; the extra rows decode after the real ones and are never read.
+# Prompts past the largest buckets decode on the uncompiled model instead
+def sample_questions(model, tokenizer, last_hidden_state, attention_mask):
+    generate = model.generate
+    if mcq_compiled and fits_buckets(attention_mask):
+        last_hidden_state, attention_mask = pad_to_buckets(last_hidden_state), pad_to_buckets(attention_mask)
+        generate = functools.partial(compiled_generate, model)
+    elif mcq_compiled:
+        generate = eager_model(model, attention_mask).generate
+    return generate(
+        encoder_outputs=BaseModelOutput(last_hidden_state=last_hidden_state),
+        attention_mask=attention_mask,
+        **question_generation_options(tokenizer)
+    )
 
-    output = model.generate(
-        input_ids,
-        max_length=50,
+# Function to sample questions for several requests in one decode. Each item is
+# (last_hidden_state, attention_mask, num_candidates) from encode_prompt; prompts are
+# right-padded to the longest one and each is repeated once per candidate
+def decode_question_batch(items, tier="quality"):
+    model, tokenizer = registry.get(registry_name("mcq", tier))
+    max_length = max(last_hidden_state.shape[1] for last_hidden_state, _, _ in items)
+
+    hidden_rows = []
+    mask_rows = []
+    for last_hidden_state, attention_mask, num_candidates in items:
+        padding = max_length - last_hidden_state.shape[1]
+        hidden_rows.append(F.pad(last_hidden_state, (0, 0, 0, padding)).expand(num_candidates, -1, -1))
+        mask_rows.append(F.pad(attention_mask, (0, padding)).expand(num_candidates, -1))
+
+    outputs = sample_questions(model, tokenizer, torch.cat(hidden_rows), torch.cat(mask_rows))
+    decoded = [tokenizer.decode(output, skip_special_tokens=True).strip() for output in outputs]
+
+    results = []
+    start = 0
+    for _, _, num_candidates in items:
+        results.append(decoded[start:start + num_candidates])
+        start += num_candidates
+    return results
+
+# Function to sample answers for tokenized prompts, padded to the shape buckets like questions
+def sample_answers(model, tokenizer, input_ids, attention_mask):
+    generate = model.generate
+    if mcq_compiled and fits_buckets(input_ids):
+        input_ids, attention_mask = pad_to_buckets(input_ids, tokenizer.pad_token_id), pad_to_buckets(attention_mask)
+        generate = functools.partial(compiled_generate, model)
+    elif mcq_compiled:
+        generate = eager_model(model, input_ids).generate
+    return generate(
+        input_ids=input_ids,
+        attention_mask=attention_mask,
+        max_length=20,
         do_sample=True,
-        temperature=0.7
+        temperature=0.5
     )
-    return tokenizer.decode(output[0], skip_special_tokens=True).strip()
+
+# Function to answer the questions of several requests in one padded decode, each item is a list of prompts
+def decode_answer_batch(items, tier="quality"):
+    model, tokenizer = registry.get(registry_name("mcq", tier))
+    input_texts = [input_text for prompts in items for input_text in prompts]
+    inputs = tokenizer(input_texts, return_tensors="pt", padding=True).to(device)
+
+    outputs = sample_answers(model, tokenizer, inputs.input_ids, inputs.attention_mask)
+    decoded = [tokenizer.decode(output, skip_special_tokens=True).strip() for output in outputs]
+
+    results = []
+    start = 0
+    for prompts in items:
+        results.append(decoded[start:start + len(prompts)])
+        start += len(prompts)
+    return results
+
+# Concurrent requests share decodes through these batchers, one pair per tier since only
+# requests on the same model can share a decode; sizes are counted in decoded rows
+mcq_batching = os.environ.get("MCQ_BATCHING", "1") == "1"
+mcq_batch_max_size = int(os.environ.get("MCQ_BATCH_MAX_SIZE", "64"))
+mcq_batch_max_wait = float(os.environ.get("MCQ_BATCH_MAX_WAIT_MS", "5")) / 1000
+
+question_batchers = {
+    tier: MicroBatcher(functools.partial(decode_question_batch, tier=tier), mcq_batch_max_size, mcq_batch_max_wait,
+                       item_size=lambda item: item[2], name=f"mcq-question-batcher-{tier}")
+    for tier in model_paths
+}
+answer_batchers = {
+    tier: MicroBatcher(functools.partial(decode_answer_batch, tier=tier), mcq_batch_max_size, mcq_batch_max_wait,
+                       item_size=len, name=f"mcq-answer-batcher-{tier}")
+    for tier in model_paths
+}
+for batcher in [*question_batchers.values(), *answer_batchers.values()]:
+    track_queue(batcher.name, lambda batcher=batcher: batcher.depth)
+
+# Function to sample several candidate questions in a single batched decode
+def generate_questions(text, num_candidates=8, encoder_cache=None, tier="quality"):
+    input_text = f"Generate a single question from the following text: {text}"
+    last_hidden_state, attention_mask = encode_prompt(input_text, encoder_cache, tier)
+
+    item = (last_hidden_state, attention_mask, num_candidates)
+    if mcq_batching:
+        return question_batchers[tier](item)
+    return decode_question_batch([item], tier)[0]
+
+# Function to generate a question
+def generate_question(text, tier="quality"):
+    return generate_questions(text, num_candidates=1, tier=tier)[0]
+
+# Function to answer several questions about the same text in one padded batch
+def generate_answers(paragraph, questions, tier="quality"):
+    input_texts = [
+        f"Based on this text: {paragraph}. What is the correct answer to this question: {question}? Give a short, concise answer only."
+        for question in questions
+    ]
+    raw_answers = answer_batchers[tier](input_texts) if mcq_batching else decode_answer_batch([input_texts], tier)[0]
+    return [extract_key_answer(raw_answer) for raw_answer in raw_answers]
 
 # Function to parse the raw question output
 def parse_question_output(raw_output):
@@ -100,16 +293,8 @@ def parse_question_output(raw_output):
             "distractors": []
         }
 
-# Create distractors manually if needed - IMPROVED to ensure uniqueness
-def create_distractors(text, correct_answer, existing_distractors=None):
-    # Start with any existing distractors
-    distractors = [] if existing_distractors is None else existing_distractors.copy()
-
-    # Clean up any trailing characters (like '|')
-    distractors = [d.rstrip('| ') for d in distractors]
-
-    # Predefined wrong answers related to water cycle
-    water_cycle_distractors = {
+# Predefined wrong answers related to water cycle
+water_cycle_distractors = {
         "water cycle": ["carbon cycle", "nitrogen cycle", "rock cycle", "life cycle",
                         "oxygen cycle", "phosphorus cycle", "nutrient cycle"],
         "evaporation": ["sublimation", "transpiration", "infiltration", "runoff",
@@ -1028,10 +1213,10 @@ def create_distractors(text, correct_answer, existing_distractors=None):
 
 
 
-    }
+}
 
-    # Additional general science distractors
-    general_science_distractors = [
+# Additional general science distractors
+general_science_distractors = [
         # Physics concepts
     "Newton's laws", "gravitation", "friction", "momentum", "inertia", "work", "energy", "power",
     "velocity", "acceleration", "projectile motion", "circular motion", "simple harmonic motion",
@@ -1065,17 +1250,27 @@ def create_distractors(text, correct_answer, existing_distractors=None):
     "biodiversity hotspots", "ecological footprint", "carbon footprint", "environmental impact",
     "solid waste management", "bioremediation", "phytoremediation", "ecological succession",
     "carrying capacity", "biogeography", "biosphere reserves", "national parks", "sanctuaries"
-    ]
+]
+
+# Keyword index over the distractor topics, compiled once at import
+distractor_index = KeywordIndex(water_cycle_distractors)
+
+# Create distractors manually if needed - IMPROVED to ensure uniqueness
+def create_distractors(text, correct_answer, existing_distractors=None):
+    # Start with any existing distractors
+    distractors = [] if existing_distractors is None else existing_distractors.copy()
+
+    # Clean up any trailing characters (like '|')
+    distractors = [d.rstrip('| ') for d in distractors]
 
     # Correct answer keywords for matching
     correct_lower = correct_answer.lower()
     predefined_distractors = []
 
-    # Check if any key word from our distractor dict is in the correct answer
-    for key in water_cycle_distractors:
-        if key in correct_lower:
-            predefined_distractors = water_cycle_distractors[key]
-            break
+    # Find the best topic keyword from our distractor dict in the correct answer
+    key = distractor_index.best_match(correct_answer)
+    if key is not None:
+        predefined_distractors = water_cycle_distractors[key]
 
     # If we found predefined distractors, use them
     if predefined_distractors:
@@ -1096,10 +1291,10 @@ def create_distractors(text, correct_answer, existing_distractors=None):
 
     # If we don't have enough distractors yet, add from general science
     if len(distractors) < 3:
-        # Shuffle general distractors
-        random.shuffle(general_science_distractors)
+        # Shuffle general distractors (a copy, the module-level list is shared)
+        shuffled_general = random.sample(general_science_distractors, len(general_science_distractors))
 
-        for distractor in general_science_distractors:
+        for distractor in shuffled_general:
             if (distractor not in distractors and
                 distractor.lower() != correct_answer.lower() and
                 distractor.lower() not in correct_lower and
@@ -1124,8 +1319,8 @@ def create_distractors(text, correct_answer, existing_distractors=None):
 
     return distractors[:3]
 
-# Function to format the MCQ - IMPROVED to ensure uniqueness
-def format_mcq(question, correct_answer, distractors):
+# Function to build the MCQ - IMPROVED to ensure uniqueness
+def build_mcq(question, correct_answer, distractors):
     # Clean up question
     question = question.strip()
     if not question.endswith('?'):
@@ -1162,89 +1357,109 @@ def format_mcq(question, correct_answer, distractors):
     options = [correct_answer] + unique_distractors[:3]
     random.shuffle(options)
 
-    # Format output
-    mcq = f"Question: {question}\n\n"
-    for i, option in enumerate(['A', 'B', 'C', 'D']):
-        mcq += f"{option}) {options[i]}\n"
-
-    # Add correct answer (hidden)
-    correct_option = chr(65 + options.index(correct_answer))  # A, B, C, or D
-    mcq += f"\nCorrect Answer: {correct_option}) {correct_answer}"
+    return MCQ(question, options, options.index(correct_answer))
 
-    return mcq
-
-# Track questions to avoid repetition across all generated questions
-global_used_questions = set()
-global_used_answers = set()
+# Function to format the MCQ as text, kept as an export of build_mcq
+def format_mcq(question, correct_answer, distractors):
+    return build_mcq(question, correct_answer, distractors).to_text()
 
 # Function to generate multiple MCQs from a paragraph - IMPROVED to avoid duplications
-def generate_multiple_mcqs(paragraph, num_questions=5):
+# Questions and answers are tracked in a DedupScope; pass one in to share it across
+# requests of the same session or document, otherwise it only lives for this call.
+# With structured=True the MCQs come back as MCQ objects instead of formatted text.
+# With a YieldController each round is sized from the observed yield instead of batch_size,
+# and decode_budget caps the candidate questions sampled over all rounds
+def generate_multiple_mcqs(paragraph, num_questions=5, batch_size=16, encoder_cache=None, dedup=None, tier="quality",
+                           structured=False, yield_controller=None, decode_budget=None):
     all_mcqs = []
 
+    if dedup is None:
+        dedup = DedupScope()
+
+    # The paragraph prompt is identical for every round, so encode it only once per request
+    if encoder_cache is None:
+        encoder_cache = {}
+
     # Try to generate the requested number of MCQs
     attempts = 0
-    max_attempts = num_questions * 10  # Allow more attempts in case of failures
+    max_attempts = decode_budget or num_questions * 10  # Allow more attempts in case of failures
+    if yield_controller is not None:
+        yield_key = yield_controller.key(paragraph, model_paths[tier], tier)
 
     while len(all_mcqs) < num_questions and attempts < max_attempts:
-        attempts += 1
-       # print(f"Attempt {attempts}...")
-
-        # Generate a raw question
-        raw_question_output = generate_question(paragraph)
-
-        # Parse the raw output
-        parsed = parse_question_output(raw_question_output)
-        question = parsed["question"]
-
-        # Skip if we've already used this question or a similar one
-        question_lower = question.lower()
-        if any(question_lower == similar_question for similar_question in global_used_questions):
-          continue
-
-        correct_answer = parsed["correct_answer"]
-        existing_distractors = parsed["distractors"]
-
-        # If no correct answer was found, generate one
-        if not correct_answer:
-            # Try to generate a correct answer
-            input_text = f"Based on this text: {paragraph}. What is the correct answer to this question: {question}? Give a short, concise answer only."
-            input_ids = tokenizer(input_text, return_tensors="pt").input_ids.to(device)
-
-            output = model.generate(
-                input_ids,
-                max_length=20,
-                do_sample=True,
-                temperature=0.5
-            )
-            raw_answer = tokenizer.decode(output[0], skip_special_tokens=True).strip()
-            correct_answer = extract_key_answer(raw_answer)
-
-        # Skip if we couldn't get a valid answer or if it's a duplicate
-        if not correct_answer:
-            continue
-
-        # Check if this answer is too similar to a previous one
-        correct_lower = correct_answer.lower()
-        if any(similar_answer in correct_lower or correct_lower in similar_answer
-               for similar_answer in global_used_answers):
-            continue
-
-        # Generate distractors if needed
-        if len(existing_distractors) < 3:
-            distractors = create_distractors(paragraph, correct_answer, existing_distractors)
+        # Sample a whole round of candidate questions in one forward pass
+        if yield_controller is None:
+            num_candidates = min(batch_size, max_attempts - attempts)
         else:
-            # Clean up any trailing characters (like '|')
-            distractors = [d.rstrip('| ') for d in existing_distractors[:3]]
+            num_candidates = yield_controller.round_size(yield_key, num_questions - len(all_mcqs), max_attempts - attempts)
+        attempts += num_candidates
+        round_start = len(all_mcqs)
+
+        candidates = []
+        round_questions = set()
+        with timed("question_generation"):
+            raw_question_outputs = generate_questions(paragraph, num_candidates, encoder_cache, tier)
+        mcqs_raw.inc(len(raw_question_outputs))
+        for raw_question_output in raw_question_outputs:
+            # Parse the raw output
+            parsed = parse_question_output(raw_question_output)
+
+            # Skip if we've already used this question or sampled it earlier in this round
+            question_lower = parsed["question"].lower()
+            if question_lower in round_questions or dedup.has_question(question_lower):
+                continue
+
+            round_questions.add(question_lower)
+            candidates.append(parsed)
+
+        # If no correct answer was found, generate one - all missing answers in one batch
+        unanswered = [parsed for parsed in candidates if not parsed["correct_answer"]]
+        if unanswered:
+            with timed("answer_generation"):
+                answers = generate_answers(paragraph, [parsed["question"] for parsed in unanswered], tier)
+            for parsed, answer in zip(unanswered, answers):
+                parsed["correct_answer"] = answer
+
+        # Candidates dropped as duplicates count towards the yield, unused ones don't
+        examined = len(raw_question_outputs) - len(candidates)
+        for parsed in candidates:
+            if len(all_mcqs) >= num_questions:
+                break
+            examined += 1
+
+            question = parsed["question"]
+            correct_answer = parsed["correct_answer"]
+            existing_distractors = parsed["distractors"]
+
+            # Skip if we couldn't get a valid answer or if it's a duplicate
+            if not correct_answer:
+                continue
+
+            # Check if this answer is too similar to a previous one
+            if dedup.answer_conflicts(correct_answer):
+                continue
+
+            # Generate distractors if needed
+            if len(existing_distractors) < 3:
+                with timed("distractors"):
+                    distractors = create_distractors(paragraph, correct_answer, existing_distractors)
+            else:
+                # Clean up any trailing characters (like '|')
+                distractors = [d.rstrip('| ') for d in existing_distractors[:3]]
+
+            # Build the MCQ, rendering it only when text was asked for
+            mcq = build_mcq(question, correct_answer, distractors)
 
-        # Format the MCQ
-        formatted_mcq = format_mcq(question, correct_answer, distractors)
+            # Mark question and answer as used, unless a concurrent request just took them
+            if not dedup.add(question, correct_answer):
+                continue
+            all_mcqs.append(mcq if structured else mcq.to_text())
 
-        # Add to our list and mark question and answer as used
-        all_mcqs.append(formatted_mcq)
-        global_used_questions.add(question_lower)
-        global_used_answers.add(correct_lower)
+            # Print progress
+            logger.debug("Generated %d/%d MCQs", len(all_mcqs), num_questions)
 
-        # Print progress
-        print(f"Generated {len(all_mcqs)}/{num_questions} MCQs...")
+        if yield_controller is not None:
+            yield_controller.observe(yield_key, examined, len(all_mcqs) - round_start)
 
+    mcqs_valid.inc(len(all_mcqs))
     return all_mcqs
@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+import torch
+from backend.models.logs import get_logger
+
+
+logger = get_logger("registry")
+
+# Settings are read from the environment so each deployment can point at its own weights
+def model_device():
+    return os.environ.get("MODEL_DEVICE") or ("cuda" if torch.cuda.is_available() else "cpu")
+
+def preload_model_names():
+    names = os.environ.get("PRELOAD_MODELS", "")
+    return [name.strip() for name in names.split(",") if name.strip()]
+
+
+# Keeps every model behind a name, loads it on first use (or at startup when asked)
+# and runs a warmup inference before reporting it as ready
+class ModelRegistry:
+    def __init__(self):
+        self._loaders = {}
+        self._warmups = {}
+        self._models = {}
+        self._status = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader, warmup=None):
+        with self._lock:
+            self._loaders[name] = loader
+            self._warmups[name] = warmup
+            self._locks[name] = threading.Lock()
+            self._status[name] = "not_loaded"
+
+    def get(self, name):
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        if name not in self._loaders:
+            raise KeyError(f"Unknown model: {name}")
+
+        with self._locks[name]:
+            # Another thread may have finished loading while we waited for the lock
+            model = self._models.get(name)
+            if model is not None:
+                return model
+
+            self._status[name] = "loading"
+            started = time.perf_counter()
+            try:
+                model = self._loaders[name]()
+                warmup = self._warmups[name]
+                if warmup is not None:
+                    self._status[name] = "warming_up"
+                    warmup(model)
+            except Exception as e:
+                self._status[name] = f"failed: {e}"
+                raise
+
+            self._models[name] = model
+            self._status[name] = "ready"
+            logger.info("Model '%s' ready in %.1fs", name, time.perf_counter() - started)
+            return model
+
+    def load_all(self, names=None):
+        for name in names if names is not None else list(self._loaders):
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error("Error loading model '%s': %s", name, e)
+
+    def is_ready(self, names=None):
+        names = names if names is not None else list(self._loaders)
+        return all(name in self._models for name in names)
+
+    def status(self):
+        return dict(self._status)
+
+
+registry = ModelRegistry()
@@ -0,0 +1,31 @@
+import os
+from backend.models.registry import registry
+
+
+# Each model comes in named tiers: "quality" is the full-size model, "fast" a smaller one.
+# Clients pick a tier per request; while the inference queue is deep, quality requests
+# are served by the fast tier instead so latency stays bounded, if its model is loaded.
+tier_names = ("quality", "fast")
+default_tier = os.environ.get("DEFAULT_TIER", "quality").strip().lower()
+downgrade_queue_depth = int(os.environ.get("TIER_DOWNGRADE_DEPTH", "8"))
+
+# Function to name a tier's model in the registry, the quality tier keeps the plain name
+def registry_name(model, tier):
+    return model if tier == "quality" else f"{model}-{tier}"
+
+# Function to pick the tier a request asked for, or the server default. A tier with no
+# model configured falls back to quality; an unknown name raises ValueError
+def requested_tier(name, available):
+    tier = (name or default_tier).strip().lower()
+    if tier not in tier_names:
+        raise ValueError(f"Unknown tier '{name}', expected one of: {', '.join(tier_names)}")
+    return tier if tier in available else "quality"
+
+# Function to move a quality request to the fast tier while the queue is at least TIER_DOWNGRADE_DEPTH
+# deep. Only a fast model that is already loaded counts: loading one would take a worker for
+# minutes exactly when the queue is deepest
+def downgrade_tier(model, tier, available, queue_depth):
+    if tier == "quality" and "fast" in available and 0 < downgrade_queue_depth <= queue_depth:
+        if registry.is_ready([registry_name(model, "fast")]):
+            return "fast"
+    return tier
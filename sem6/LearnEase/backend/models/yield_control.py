@@ -0,0 +1,46 @@
+import bisect
+import math
+import threading
+
+
+# Sizes MCQ generation rounds from the share of sampled candidate questions that end up as
+# MCQs. The share is tracked as a moving average per model, tier and paragraph length,
+# since short paragraphs run out of distinct questions much sooner than long ones. A round
+# asks for enough candidates to cover what is still needed at that rate, plus a margin, so
+# most requests finish in one round without sampling far more than they use.
+class YieldController:
+    length_buckets = (40, 100, 250, 600)
+
+    def __init__(self, initial_yield=0.5, min_yield=0.05, smoothing=0.3, margin=1.25, max_round=64):
+        self.initial_yield = initial_yield
+        self.min_yield = min_yield
+        self.smoothing = smoothing
+        self.margin = margin
+        self.max_round = max_round
+        self._yields = {}
+        self._lock = threading.Lock()
+
+    # Function to key a paragraph by model, tier and word-count bucket
+    def key(self, paragraph, model, tier):
+        return model, tier, bisect.bisect_right(self.length_buckets, len(paragraph.split()))
+
+    def expected_yield(self, key):
+        with self._lock:
+            return self._yields.get(key, self.initial_yield)
+
+    # Function to size the next round for `needed` more MCQs, within the remaining decode budget
+    def round_size(self, key, needed, remaining_budget):
+        expected = max(self.expected_yield(key), self.min_yield)
+        size = max(needed, math.ceil(needed * self.margin / expected))
+        return max(0, min(size, self.max_round, remaining_budget))
+
+    # Function to record a round: `examined` candidates looked at, `produced` MCQs built from them
+    def observe(self, key, examined, produced):
+        if examined <= 0:
+            return
+        observed = produced / examined
+        with self._lock:
+            current = self._yields.get(key)
+            self._yields[key] = observed if current is None else (
+                (1 - self.smoothing) * current + self.smoothing * observed
+            )
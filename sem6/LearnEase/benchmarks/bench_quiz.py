@@ -0,0 +1,50 @@
+from main import parse_mcqs, parse_mcqs_alternative
+from backend.models.quiz import create_distractors, build_mcq, format_mcq, extract_key_answer
+
+
+def bench_create_distractors_topic(benchmark, sample_text):
+    distractors = benchmark(create_distractors, sample_text, "the process of evaporation")
+    assert len(distractors) == 3
+
+def bench_create_distractors_no_topic(benchmark, sample_text):
+    distractors = benchmark(create_distractors, sample_text, "a completely unrelated answer")
+    assert len(distractors) == 3
+
+def bench_create_distractors_existing(benchmark, sample_text):
+    distractors = benchmark(create_distractors, sample_text, "condensation", ["precipitation|", "runoff"])
+    assert len(distractors) == 3
+
+def bench_format_mcq(benchmark):
+    mcq = benchmark(format_mcq, "What process turns liquid water into vapour", "evaporation",
+                    ["condensation", "runoff", "sublimation"])
+    assert mcq.startswith("Question:")
+
+def bench_build_mcq(benchmark):
+    mcq = benchmark(lambda: build_mcq("What process turns liquid water into vapour", "evaporation",
+                                      ["condensation", "runoff", "sublimation"]).to_dict())
+    assert mcq["correct_answer"] == "evaporation"
+
+def bench_format_mcq_duplicate_distractors(benchmark):
+    mcq = benchmark(format_mcq, "What drives the water cycle", "the sun", ["The Sun", "wind", "wind"])
+    assert "Correct Answer:" in mcq
+
+def bench_extract_key_answer_separator(benchmark):
+    answer = benchmark(extract_key_answer, "What drives the water cycle? ||| the sun ||| wind")
+    assert answer == "the sun"
+
+def bench_extract_key_answer_long(benchmark):
+    answer = benchmark(extract_key_answer,
+                       "The continuous movement of water on, above and below the surface is called the water cycle. It never stops")
+    assert answer
+
+def bench_extract_key_answer_short(benchmark):
+    answer = benchmark(extract_key_answer, "evaporation")
+    assert answer == "evaporation"
+
+def bench_parse_mcqs(benchmark, raw_mcqs):
+    parsed = benchmark(lambda: [parse_mcqs(raw_mcq) for raw_mcq in raw_mcqs])
+    assert all(mcq and len(mcq["options"]) == 4 for mcq in parsed)
+
+def bench_parse_mcqs_alternative(benchmark, alternative_mcqs):
+    parsed = benchmark(lambda: [parse_mcqs_alternative(raw_mcq) for raw_mcq in alternative_mcqs])
+    assert all(mcq and len(mcq["options"]) == 4 for mcq in parsed)
@@ -0,0 +1,30 @@
+from main import chunk_text, extract_pdf_text
+
+
+def bench_chunk_text_sample(benchmark, sample_text):
+    chunks = benchmark(chunk_text, sample_text)
+    assert chunks
+
+def bench_chunk_text_long(benchmark, long_text):
+    chunks = benchmark(chunk_text, long_text)
+    assert len(chunks) > 1
+
+def bench_chunk_text_long_with_overlap(benchmark, long_text):
+    chunks = benchmark(chunk_text, long_text, 400, 100)
+    assert len(chunks) > 1
+
+def bench_chunk_text_tokenizer_sample(benchmark, sample_text, tokenizer):
+    chunks = benchmark(chunk_text, sample_text, tokenizer=tokenizer)
+    assert chunks
+
+def bench_chunk_text_tokenizer_long(benchmark, long_text, tokenizer):
+    chunks = benchmark(chunk_text, long_text, tokenizer=tokenizer)
+    assert len(chunks) > 1
+
+def bench_extract_pdf_text_bytes(benchmark, sample_pdf_bytes):
+    text = benchmark(extract_pdf_text, sample_pdf_bytes)
+    assert text.strip()
+
+def bench_extract_pdf_text_path(benchmark, sample_pdf_path):
+    text = benchmark(extract_pdf_text, sample_pdf_path)
+    assert text.strip()
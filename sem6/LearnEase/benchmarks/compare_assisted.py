@@ -0,0 +1,67 @@
+# Compares the summarizer's default decoding (the checkpoint's beam search), plain greedy
+# decoding and assisted decoding (a small draft model proposing tokens for BART to check) on a
+# fixed set of chunks taken from sample.pdf: latency per chunk, and how often assisted output
+# matches greedy (it should be always) and the default decoding (what turning it on changes).
+# The draft model defaults to SUMMARY_DRAFT_MODEL, or the fast tier model when that isn't set.
+#
+#   python benchmarks/compare_assisted.py --runs 3
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+from backend.models.pdf_text import extract_pdf_text
+from backend.models.assisted import load_draft_model, assisted_options
+from main import model_name as summarizer_model_name, fast_model_name as summarizer_fast_model_name, chunk_text
+
+
+# Function to decode every input and return (outputs, mean seconds per input)
+def run_model(model, tokenizer, inputs, options, runs):
+    outputs = []
+    started = time.perf_counter()
+    for _ in range(runs):
+        outputs = []
+        for text in inputs:
+            input_ids = tokenizer(text, return_tensors="pt", truncation=True).input_ids
+            with torch.no_grad():
+                output = model.generate(input_ids, do_sample=False, **options)
+            outputs.append(tokenizer.decode(output[0], skip_special_tokens=True).strip())
+    return outputs, (time.perf_counter() - started) / (runs * len(inputs))
+
+def match_rate(outputs, other_outputs):
+    return sum(a == b for a, b in zip(outputs, other_outputs)) / len(outputs)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample.pdf"))
+    parser.add_argument("--inputs", type=int, default=4, help="number of chunks to use")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--draft", default=os.environ.get("SUMMARY_DRAFT_MODEL") or summarizer_fast_model_name)
+    parser.add_argument("--max-length", type=int, default=300)
+    parser.add_argument("--min-length", type=int, default=50)
+    args = parser.parse_args()
+
+    chunks = chunk_text(extract_pdf_text(args.pdf), max_tokens=800)[:args.inputs]
+    tokenizer = AutoTokenizer.from_pretrained(summarizer_model_name)
+    model = AutoModelForSeq2SeqLM.from_pretrained(summarizer_model_name).eval()
+    draft_model = load_draft_model(args.draft, main_name_or_path=summarizer_model_name)
+
+    options = {"max_length": args.max_length, "min_length": args.min_length}
+    default_outputs, default_latency = run_model(model, tokenizer, chunks, options, args.runs)
+    greedy_outputs, greedy_latency = run_model(model, tokenizer, chunks, dict(options, num_beams=1), args.runs)
+    assisted_outputs, assisted_latency = run_model(
+        model, tokenizer, chunks, dict(options, **assisted_options(draft_model, args.min_length)), args.runs)
+
+    print(f"\nSummarizer ({summarizer_model_name}, draft {args.draft}), {len(chunks)} chunks x {args.runs} runs")
+    print(f"  {'default (' + str(model.generation_config.num_beams) + ' beams)':16} {default_latency * 1000:>10.1f}ms/chunk")
+    print(f"  {'greedy':16} {greedy_latency * 1000:>10.1f}ms/chunk")
+    print(f"  {'assisted':16} {assisted_latency * 1000:>10.1f}ms/chunk")
+    print(f"  assisted vs greedy: {greedy_latency / assisted_latency:.2f}x, exact match {match_rate(assisted_outputs, greedy_outputs):.0%}")
+    print(f"  assisted vs default: {default_latency / assisted_latency:.2f}x, exact match {match_rate(assisted_outputs, default_outputs):.0%}")
+
+if __name__ == "__main__":
+    main()
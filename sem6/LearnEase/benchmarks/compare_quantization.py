@@ -0,0 +1,123 @@
+# Compares fp32 and int8 dynamic-quantized CPU inference for the summarizer and the MCQ model
+# on a fixed set of inputs taken from sample.pdf: latency, size on disk (the serialized state dict),
+# peak resident memory while decoding and how often the quantized model produces the same output
+# as fp32 (both decode greedily). Memory needs psutil, from requirements-dev.txt.
+#
+#   python benchmarks/compare_quantization.py --runs 3
+import argparse
+import difflib
+import gc
+import io
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psutil
+import torch
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, T5ForConditionalGeneration, T5Tokenizer
+from backend.models.pdf_text import extract_pdf_text
+from backend.models.quantization import load_quantized_model
+from backend.models.quiz import model_path as mcq_model_path
+from main import model_name as summarizer_model_name, chunk_text
+
+
+# Function to measure a model's size on disk as its serialized state dict, which covers int8
+# packed weights too. This is not the memory used while it runs
+def model_disk_size_mb(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / (1024 * 1024)
+
+# Function to read the resident memory of this process
+def rss_mb():
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+# Samples resident memory on a background thread and keeps the peak. torch keeps no
+# allocator statistics for CPU tensors, so this is the only view of decoding memory
+class PeakRSS:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, rss_mb())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak_mb = rss_mb()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, rss_mb())
+
+# Function to decode every input and return (outputs, mean seconds per input)
+def run_model(model, tokenizer, inputs, max_length, runs):
+    outputs = []
+    started = time.perf_counter()
+    for _ in range(runs):
+        outputs = []
+        for text in inputs:
+            input_ids = tokenizer(text, return_tensors="pt", truncation=True).input_ids
+            with torch.no_grad():
+                output = model.generate(input_ids, max_length=max_length, do_sample=False)
+            outputs.append(tokenizer.decode(output[0], skip_special_tokens=True).strip())
+    return outputs, (time.perf_counter() - started) / (runs * len(inputs))
+
+# Function to load one model, decode every input with it and free it again, so each model is
+# measured alone. Returns (outputs, mean seconds per input, size on disk in MB, peak resident
+# memory while decoding in MB, counted from before the model was loaded)
+def measure(load, tokenizer, inputs, max_length, runs):
+    gc.collect()
+    baseline = rss_mb()
+    model = load()
+    with PeakRSS() as peak:
+        outputs, latency = run_model(model, tokenizer, inputs, max_length, runs)
+    disk_size = model_disk_size_mb(model)
+    del model
+    gc.collect()
+    return outputs, latency, disk_size, peak.peak_mb - baseline
+
+def compare(name, model_class, tokenizer_class, name_or_path, inputs, max_length, runs):
+    tokenizer = tokenizer_class.from_pretrained(name_or_path)
+    fp32_outputs, fp32_latency, fp32_size, fp32_memory = measure(
+        lambda: model_class.from_pretrained(name_or_path).eval(), tokenizer, inputs, max_length, runs)
+    int8_outputs, int8_latency, int8_size, int8_memory = measure(
+        lambda: load_quantized_model(model_class, name_or_path), tokenizer, inputs, max_length, runs)
+
+    exact = sum(a == b for a, b in zip(fp32_outputs, int8_outputs)) / len(inputs)
+    similarity = sum(difflib.SequenceMatcher(None, a.split(), b.split()).ratio()
+                     for a, b in zip(fp32_outputs, int8_outputs)) / len(inputs)
+
+    print(f"\n{name} ({name_or_path}), {len(inputs)} inputs x {runs} runs")
+    print(f"  {'':6} {'latency/input':>14} {'size on disk':>14} {'decode RSS':>14}")
+    print(f"  {'fp32':6} {fp32_latency * 1000:>12.1f}ms {fp32_size:>12.1f}MB {fp32_memory:>12.1f}MB")
+    print(f"  {'int8':6} {int8_latency * 1000:>12.1f}ms {int8_size:>12.1f}MB {int8_memory:>12.1f}MB")
+    print(f"  speedup {fp32_latency / int8_latency:.2f}x, exact match {exact:.0%}, token similarity {similarity:.0%}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample.pdf"))
+    parser.add_argument("--inputs", type=int, default=4, help="number of chunks/paragraphs to use")
+    parser.add_argument("--runs", type=int, default=1)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    text = extract_pdf_text(args.pdf)
+    chunks = chunk_text(text, max_tokens=400)[:args.inputs]
+    paragraphs = chunk_text(text, max_tokens=120)[:args.inputs]
+    prompts = [f"Generate a single question from the following text: {paragraph}" for paragraph in paragraphs]
+
+    compare("Summarizer", AutoModelForSeq2SeqLM, AutoTokenizer, summarizer_model_name, chunks, 150, args.runs)
+    compare("MCQ model", T5ForConditionalGeneration, T5Tokenizer, mcq_model_path, prompts, 50, args.runs)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+import random
+import sys
+import tempfile
+import pytest
+
+# Benchmarks import the backend straight from the source tree, and never load a model
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MODEL_DEVICE", "cpu")
+os.environ["PRELOAD_MODELS"] = ""
+os.environ["SUMMARY_CACHE_DIR"] = tempfile.mkdtemp(prefix="learnease-bench-")
+
+import main
+from backend.models.registry import registry
+from backend.models.quiz import format_mcq
+
+
+# Function standing in for every model loader, so a benchmark that reaches a model fails fast
+def stub_loader():
+    raise RuntimeError("Benchmarks run without models, stub out the call that needs one")
+
+for name in registry.status():
+    registry.register(name, stub_loader)
+
+
+@pytest.fixture(autouse=True)
+def seeded_random():
+    random.seed(0)
+
+@pytest.fixture(scope="session")
+def sample_pdf_path():
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample.pdf")
+
+@pytest.fixture(scope="session")
+def sample_pdf_bytes(sample_pdf_path):
+    with open(sample_pdf_path, "rb") as f:
+        return f.read()
+
+@pytest.fixture(scope="session")
+def sample_text(sample_pdf_bytes):
+    return main.extract_pdf_text(sample_pdf_bytes)
+
+# A textbook-sized document: the sample repeated until it is a few hundred pages of text
+@pytest.fixture(scope="session")
+def long_text(sample_text):
+    return "\n\n".join([sample_text] * 200)
+
+# A real sentencepiece tokenizer for the token-counting chunker: the MCQ model's, which
+# ships in the repo (the BART tokenizer is only downloaded with the model)
+@pytest.fixture(scope="session")
+def tokenizer():
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                      "backend", "mcq_t5_finetuned1"))
+
+@pytest.fixture(scope="session")
+def raw_mcqs():
+    random.seed(0)
+    return [
+        format_mcq("What process turns liquid water into vapour", "evaporation", ["condensation", "runoff", "sublimation"]),
+        format_mcq("Which force keeps the Moon in orbit", "gravitational force", ["magnetism", "friction", "buoyancy"]),
+        format_mcq("What is the variety of life on Earth called", "biodiversity", ["ecosystem", "habitat", "biome"]),
+    ]
+
+# The same questions in the looser layout parse_mcqs_alternative exists for
+@pytest.fixture(scope="session")
+def alternative_mcqs():
+    return [
+        "1. What process turns liquid water into vapour?\nA. condensation\nB. evaporation\nC. runoff\nD. sublimation\nAnswer is B",
+        "Question: Which force keeps the Moon in orbit?\nA: magnetism\nB: friction\nC: gravitational force\nD: buoyancy\nAnswer: C gravitational force",
+        "2) What is the variety of life on Earth called?\nA) ecosystem\nB) habitat\nC) biome\nD) biodiversity\nCorrect Answer: D",
+    ]
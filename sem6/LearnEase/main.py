@@ -1,14 +1,38 @@
 from fastapi import FastAPI, File, UploadFile
 import uvicorn
 import os
-import fitz
 import torch
-from transformers import pipeline
-import tempfile
+from transformers import pipeline, AutoModelForSeq2SeqLM, AutoTokenizer
 from pydantic import BaseModel
+from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
-from backend.models.quiz import generate_multiple_mcqs
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from starlette.background import BackgroundTask
+from backend.models.quiz import generate_multiple_mcqs, model_paths as mcq_model_paths
+from backend.models.registry import registry, model_device, preload_model_names
+from backend.models.inference_pool import inference_pool, PoolFullError
+from backend.models.batching import MicroBatcher
+from backend.models.summary_cache import SummaryCache
+from backend.models.mcq_pool import MCQPool
+from backend.models.dedup import DedupStore
+from backend.models.pdf_text import extract_pdf_text, extract_pdf_pages
+from backend.models.quantization import quantization_mode, load_quantized_model
+from backend.models.onnx_backend import inference_backend, load_onnx_model
+from backend.models.assisted import assisted_decoding_available, load_draft_model, assisted_options
+from backend.models.tiers import registry_name, requested_tier, downgrade_tier
+from backend.models.metrics import timed, track_queue, chunks_summarized, render_metrics, metrics_content_type
+from backend.models.mcq import MCQ
+from backend.models.yield_control import YieldController
+from backend.models.logs import get_logger
 import re 
+import bisect
+import itertools
+import collections
+import json
+import threading
+import functools
+from concurrent.futures import as_completed
 
 app = FastAPI()
 
@@ -22,100 +46,517 @@ app.add_middleware(
 
 os.environ["CUDA_LAUNCH_BLOCKING"] = "1"
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model_name = "facebook/bart-large-cnn"  
-summarizer = pipeline("summarization", model=model_name, device=0 if device == "cuda" else -1)
-
-def extract_pdf_text(pdf_path):
-    doc = fitz.open(pdf_path)
-    text = ""
-    for page_num in range(doc.page_count):
-        page = doc.load_page(page_num)
-        text += page.get_text("text")  
-    return text
-
-def chunk_text(text, chunk_size=2000):
-    chunks = []
-    while len(text) > chunk_size:
-        idx = text[:chunk_size].rfind(".")
-        if idx == -1:
-            idx = chunk_size
-        chunks.append(text[:idx + 1])
-        text = text[idx + 1:].strip()
-    if text:
-        chunks.append(text)
-    return chunks
-
-def hierarchical_summarization(text):
-    chunks = chunk_text(text)
-    chunk_summaries = []
+device = model_device()
+model_name = os.environ.get("SUMMARIZER_MODEL", "facebook/bart-large-cnn")
+# The fast tier uses a distilled BART, set SUMMARIZER_FAST_MODEL to "" to turn it off
+fast_model_name = os.environ.get("SUMMARIZER_FAST_MODEL", "sshleifer/distilbart-cnn-12-6")
+summarizer_models = {"quality": model_name}
+if fast_model_name:
+    summarizer_models["fast"] = fast_model_name
 
+# Function to build the BART summarization pipeline
+def load_summarizer(name=model_name):
+    if inference_backend() == "onnx":
+        model = load_onnx_model(name, device)
+        return pipeline("summarization", model=model, tokenizer=AutoTokenizer.from_pretrained(name))
+    # int8 dynamic quantization only applies to CPU inference
+    if quantization_mode() == "int8" and device == "cpu":
+        model = load_quantized_model(AutoModelForSeq2SeqLM, name)
+        return pipeline("summarization", model=model, tokenizer=AutoTokenizer.from_pretrained(name), device=-1)
+    return pipeline("summarization", model=name, device=0 if device == "cuda" else -1)
+
+# Function to run one short summary so the first upload doesn't pay for lazy initialisation
+def warmup_summarizer(summarizer):
+    summarizer("The water cycle moves water between the oceans, the air and the land. " * 4,
+               max_length=20, min_length=5, do_sample=False)
+
+for tier, name in summarizer_models.items():
+    registry.register(registry_name("summarizer", tier), functools.partial(load_summarizer, name), warmup_summarizer)
+
+# With SUMMARY_DRAFT_MODEL set, quality-tier summaries are decoded greedily one chunk at a
+# time with that model drafting tokens for BART, usually the distilled fast-tier checkpoint.
+# That replaces the checkpoint's beam search and the batched decode, so summaries change and
+# throughput under load can drop; it trades both for lower latency per chunk
+summary_draft_model = os.environ.get("SUMMARY_DRAFT_MODEL", "")
+summary_assisted = assisted_decoding_available(summary_draft_model)
+if summary_assisted:
+    registry.register("summarizer-draft", functools.partial(load_draft_model, summary_draft_model, device, model_name))
+
+logger = get_logger("main")
+
+# Models named in PRELOAD_MODELS load in the background at startup, the rest on first use
+@app.on_event("startup")
+def preload_models():
+    names = preload_model_names()
+    if names:
+        threading.Thread(target=registry.load_all, args=(names,), daemon=True).start()
+
+# A full inference queue is reported as 503 with Retry-After instead of queueing without bound
+@app.exception_handler(PoolFullError)
+async def pool_full_handler(request, exc):
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+        content={"error": str(exc), "queue_depth": inference_pool.depth}
+    )
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    status = registry.status()
+    if not registry.is_ready(preload_model_names()):
+        return JSONResponse(status_code=503, content={"ready": False, "models": status})
+    return {"ready": True, "models": status}
+
+@app.get("/metrics")
+def metrics():
+    return Response(render_metrics(), media_type=metrics_content_type)
+
+# Chunks are packed up to this many BART tokens (the model takes 1024 with special tokens)
+chunk_max_tokens = int(os.environ.get("SUMMARY_CHUNK_TOKENS", "1000"))
+chunk_overlap_tokens = int(os.environ.get("SUMMARY_CHUNK_OVERLAP", "0"))
+
+sentence_break = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+word_pattern = re.compile(r"\S+")
+
+# Function to yield the (start, end) offsets of each sentence in one pass over the text
+def sentence_spans(text):
+    start = len(text) - len(text.lstrip())
+    end = len(text.rstrip())
+    for match in sentence_break.finditer(text, start, end):
+        if match.start() > start:
+            yield start, match.start()
+        start = match.end()
+    if start < end:
+        yield start, end
+
+# Function to count tokens per sentence, tokenizing in blocks. Without a tokenizer words are counted.
+# With one, each sentence is tokenized together with the whitespace before it, so the spaces
+# and newlines between sentences are counted as they will be once the chunk is encoded
+def sentence_tokens(text, tokenizer=None, block_size=256):
+    spans = sentence_spans(text)
+    previous_end = None
+    while True:
+        block = list(itertools.islice(spans, block_size))
+        if not block:
+            return
+        if tokenizer is None:
+            counts = [len(text[start:end].split()) for start, end in block]
+        else:
+            segments = []
+            for start, end in block:
+                segments.append(text[start if previous_end is None else previous_end:end])
+                previous_end = end
+            counts = [len(input_ids) for input_ids in tokenizer(segments, add_special_tokens=False).input_ids]
+        for (start, end), count in zip(block, counts):
+            yield start, end, count
+
+# Function to cut a sentence longer than the budget into pieces of at most max_tokens tokens
+def split_long_sentence(text, start, end, max_tokens, tokenizer=None):
+    sentence = text[start:end]
+    if tokenizer is None:
+        offsets = [match.span() for match in word_pattern.finditer(sentence)]
+    else:
+        offsets = tokenizer(sentence, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    for i in range(0, len(offsets), max_tokens):
+        piece = offsets[i:i + max_tokens]
+        piece_start = start + piece[0][0]
+        # Sentencepiece offsets include the space before a word
+        while text[piece_start].isspace():
+            piece_start += 1
+        yield piece_start, start + piece[-1][1]
+
+# Function to yield (start, end) offsets of chunks packed with whole sentences up to
+# max_tokens tokens. With overlap_tokens, each chunk repeats the last sentences of the
+# previous one up to that many tokens. Single pass: nothing is sliced or copied until
+# the caller asks for the chunk text.
+def chunk_spans(text, max_tokens=None, overlap_tokens=None, tokenizer=None):
+    max_tokens = max_tokens or chunk_max_tokens
+    if tokenizer is not None:
+        # Leave room for the special tokens the model adds around every chunk
+        max_tokens = min(max_tokens, tokenizer.model_max_length - tokenizer.num_special_tokens_to_add())
+    overlap_tokens = chunk_overlap_tokens if overlap_tokens is None else overlap_tokens
+    window = collections.deque()
+    total = 0
+
+    for start, end, count in sentence_tokens(text, tokenizer):
+        if count > max_tokens:
+            if window:
+                yield window[0][0], window[-1][1]
+                window.clear()
+                total = 0
+            yield from split_long_sentence(text, start, end, max_tokens, tokenizer)
+            continue
+
+        if window and total + count > max_tokens:
+            yield window[0][0], window[-1][1]
+            # Carry trailing sentences over as overlap, as long as the new sentence still fits
+            kept = collections.deque()
+            kept_total = 0
+            while (window and kept_total + window[-1][2] <= overlap_tokens and
+                   kept_total + window[-1][2] + count <= max_tokens):
+                sentence = window.pop()
+                kept.appendleft(sentence)
+                kept_total += sentence[2]
+            window, total = kept, kept_total
+
+        window.append((start, end, count))
+        total += count
+
+    if window:
+        yield window[0][0], window[-1][1]
+
+def chunk_text(text, max_tokens=None, overlap_tokens=None, tokenizer=None):
+    return [text[start:end] for start, end in chunk_spans(text, max_tokens, overlap_tokens, tokenizer)]
+
+# Function to get the summarizer's tokenizer, used to size chunks in real model tokens
+def summarizer_tokenizer(tier="quality"):
+    return registry.get(registry_name("summarizer", tier)).tokenizer
+
+# Function to map a character offset in the joined text to its 1-based page number
+def page_at(page_starts, offset):
+    return bisect.bisect_right(page_starts, offset)
+
+# Function to work out the summary length budget for one chunk
+def summary_max_length(chunk):
+    input_length = len(chunk.split())
+    max_length = min(300, input_length // 2 + 50)
+    max_length = min(max_length, 500)  
+    if input_length < 10:
+        max_length = min(50, input_length)
+    return max_length
+
+# Function to group item indices into batches of similar summary budget and token length.
+# Every budget in a batch is within budget_tolerance of every other one
+def summary_batches(lengths, budgets, batch_size=8, budget_tolerance=32):
+    order = sorted(range(len(lengths)), key=lambda i: (budgets[i], lengths[i]))
+    batches = []
+    for i in order:
+        batch = batches[-1] if batches else None
+        if (batch is None or len(batch) >= batch_size or
+                max(budgets[j] for j in batch + [i]) - min(budgets[j] for j in batch + [i]) > budget_tolerance):
+            batches.append([i])
+        else:
+            batch.append(i)
+    return batches
+
+# Function to summarize one padded batch, falling back to one chunk at a time if the batch fails.
+# With a draft model every chunk is decoded on its own, since assisted decoding takes one sequence
+def summarize_batch(summarizer, chunks, budgets, draft_model=None):
+    options = {"do_sample": False, "min_length": 50, "truncation": True}
+    if draft_model is not None:
+        options.update(assisted_options(draft_model, options["min_length"]))
+    else:
+        # Budgets in a batch are close, the smallest keeps every chunk within its own max_length
+        max_length = min(budgets)
+        try:
+            results = summarizer(chunks, max_length=max_length, batch_size=len(chunks), **options)
+            return [result['summary_text'] for result in results]
+        except Exception as e:
+            logger.warning("Error summarizing batch of %d chunks, retrying one by one: %s", len(chunks), e)
+
+    summaries = []
+    for i, (chunk, budget) in enumerate(zip(chunks, budgets)):
+        try:
+            summary = summarizer(chunk, max_length=budget, **options)
+            summaries.append(summary[0]['summary_text'])
+        except Exception as e:
+            logger.error("Error summarizing chunk %d of batch: %s", i + 1, e)
+            summaries.append(None)
+    return summaries
+
+# Function to summarize the (chunk, budget) items pooled from every in-flight document.
+# Items are bucketed by token length so each forward pass pads as little as possible
+def run_summary_batch(items, tier="quality"):
+    summarizer = registry.get(registry_name("summarizer", tier))
+    draft_model = registry.get("summarizer-draft") if summary_assisted and tier == "quality" else None
+    chunks = [chunk for chunk, _ in items]
+    budgets = [budget for _, budget in items]
+    lengths = [len(input_ids) for input_ids in summarizer.tokenizer(chunks, truncation=True).input_ids]
+
+    summaries = [None] * len(items)
+    for batch in summary_batches(lengths, budgets, summary_batch_size):
+        with timed("summarization"):
+            results = summarize_batch(summarizer, [chunks[i] for i in batch], [budgets[i] for i in batch], draft_model)
+        chunks_summarized.inc(len(batch))
+        for i, summary in zip(batch, results):
+            summaries[i] = summary
+    return summaries
+
+# Chunks from all uploads on the same tier share one batcher: it pools up to
+# SUMMARY_POOL_SIZE chunks, then runs them SUMMARY_BATCH_SIZE at a time
+summary_batch_size = int(os.environ.get("SUMMARY_BATCH_SIZE", "8"))
+summary_batchers = {
+    tier: MicroBatcher(
+        functools.partial(run_summary_batch, tier=tier),
+        max_batch_size=int(os.environ.get("SUMMARY_POOL_SIZE", "32")),
+        max_wait=float(os.environ.get("SUMMARY_BATCH_MAX_WAIT_MS", "20")) / 1000,
+        name=f"summary-batcher-{tier}"
+    )
+    for tier in summarizer_models
+}
+for batcher in summary_batchers.values():
+    track_queue(batcher.name, lambda batcher=batcher: batcher.depth)
+track_queue("inference-pool", lambda: inference_pool.depth)
+
+# Function to summarize a document's chunks, yielding (index, summary) as each one finishes
+def iter_chunk_summaries(chunks, tier="quality"):
+    futures = {}
     for i, chunk in enumerate(chunks):
         if chunk.strip():
-            input_length = len(chunk.split())
-            max_length = min(300, input_length // 2 + 50)
-            max_length = min(max_length, 500)  
-            if input_length < 10:
-                max_length = min(50, input_length)
-
-            try:
-                summary = summarizer(chunk, max_length=max_length, min_length=50, do_sample=False)
-                chunk_summaries.append(summary[0]['summary_text'])
-            except Exception as e:
-                print(f"Error summarizing chunk {i + 1}: {e}")
-
-    return " ".join(chunk_summaries)
+            futures[summary_batchers[tier].submit((chunk, summary_max_length(chunk)))] = i
+
+    for future in as_completed(futures):
+        summary = future.result()
+        if summary is not None:
+            yield futures[future], summary
+
+# Function to summarize chunks in padded batches, summaries come back in chunk order
+def summarize_chunks(chunks, tier="quality"):
+    summaries = [None] * len(chunks)
+    for i, summary in iter_chunk_summaries(chunks, tier):
+        summaries[i] = summary
+    return summaries
+
+# Function to check that every chunk with text got a summary, partial summaries are never cached
+def all_chunks_summarized(chunks, summaries):
+    return all(summary is not None for chunk, summary in zip(chunks, summaries) if chunk.strip())
+
+# Function to summarize a document, returns (summary, complete) where complete is False if any chunk failed
+def hierarchical_summarization(text, tier="quality"):
+    tokenizer = summarizer_tokenizer(tier)
+    with timed("chunking"):
+        chunks = chunk_text(text, tokenizer=tokenizer)
+    chunk_summaries = summarize_chunks(chunks, tier)
+
+    summary = " ".join(summary for summary in chunk_summaries if summary is not None)
+    return summary, all_chunks_summarized(chunks, chunk_summaries)
+
+# Repeated uploads of the same PDF are answered from a memory + disk cache
+summary_cache = SummaryCache(
+    os.environ.get("SUMMARY_CACHE_DIR",
+                   os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend", "summary_cache")),
+    max_memory_items=int(os.environ.get("SUMMARY_CACHE_MEMORY_ITEMS", "128")),
+    max_disk_bytes=int(os.environ.get("SUMMARY_CACHE_DISK_MB", "256")) * 1024 * 1024
+)
+
+# Function to build the cache key of a PDF, covering everything that changes its summary
+def summary_cache_key(pdf_bytes, tier="quality"):
+    draft = summary_draft_model if summary_assisted and tier == "quality" else ""
+    return SummaryCache.make_key(pdf_bytes, model=summarizer_models[tier], backend=inference_backend(), quantize=quantization_mode(),
+                                 draft=draft,
+                                 chunk_tokens=chunk_max_tokens, chunk_overlap=chunk_overlap_tokens,
+                                 min_length=50, version=2)
+
+# Function to pick the tier an upload is served at and look up its cached summary. A cached
+# summary is returned at the requested tier however deep the queue; otherwise a deep queue
+# moves the upload to the fast tier. Returns (tier, cache_key, cached)
+def resolve_summary_tier(pdf_bytes, tier):
+    tier = requested_tier(tier, summarizer_models)
+    cache_key = summary_cache_key(pdf_bytes, tier)
+    cached = summary_cache.get(cache_key)
+    if cached is None:
+        served_tier = downgrade_tier("summarizer", tier, summarizer_models, inference_pool.depth)
+        if served_tier != tier:
+            tier = served_tier
+            cache_key = summary_cache_key(pdf_bytes, tier)
+            cached = summary_cache.get(cache_key)
+    return tier, cache_key, cached
+
+# Function to cache a finished summary, unless a chunk failed or nothing was summarized
+def cache_summary(cache_key, summary, complete):
+    if not complete or not summary.strip():
+        logger.warning("Not caching summary: %s", "a chunk failed" if not complete else "summary is empty")
+        return
+    summary_cache.put(cache_key, {"summary": summary})
+
+# Function to extract and summarize an uploaded PDF, runs on the inference pool.
+# Returns None when the PDF has no text, else (summary, complete)
+def summarize_pdf(pdf_bytes, tier="quality"):
+    with timed("extraction"):
+        extracted_text = extract_pdf_text(pdf_bytes)
+    logger.debug("Extracted %d characters from %d bytes", len(extracted_text), len(pdf_bytes))
+
+    if not extracted_text.strip():
+        return None
+
+    return hierarchical_summarization(extracted_text, tier)
+
+# Function to extract the pages of an uploaded PDF for streaming, runs on the inference pool
+def extract_pages(pdf_bytes):
+    with timed("extraction"):
+        return extract_pdf_pages(pdf_bytes)
+
 @app.post("/upload_pdf/")
-async def upload_pdf(file: UploadFile = File(...)):
+async def upload_pdf(file: UploadFile = File(...), tier: Optional[str] = None):
     try:
-        print("Request received!")
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-            temp_file.write(await file.read())
-            temp_path = temp_file.name
-        extracted_text = extract_pdf_text(temp_path)
-        print(f"Extracted Text: {extracted_text[:500]}")  
-
-        if not extracted_text.strip():
+        with timed("upload_read"):
+            pdf_bytes = await file.read()
+        logger.info("Upload received: %d bytes", len(pdf_bytes))
+        # Hashing the PDF and reading the disk cache stay off the event loop
+        tier, cache_key, cached = await run_in_threadpool(resolve_summary_tier, pdf_bytes, tier)
+        if cached is not None:
+            return {"summary": cached["summary"], "tier": tier}
+
+        result = await inference_pool.run(summarize_pdf, pdf_bytes, tier)
+        if result is None:
             return {"error": "No text found in PDF"}
 
-        summary = hierarchical_summarization(extracted_text)
+        summary, complete = result
+        # Every chunk failing is an error, not an empty summary
+        if not summary.strip():
+            return {"error": "Failed to summarize PDF: no chunk could be summarized"}
+        await run_in_threadpool(cache_summary, cache_key, summary, complete)
+
+        return {"summary": summary, "tier": tier}
+    except PoolFullError:
+        raise
+    except Exception as e:
+        logger.error("Error during processing: %s", e)
+        return {"error": f"Failed to process PDF: {e}"}
+
+# Function to produce the NDJSON events of a streamed summary, one line per finished chunk
+def stream_summary_events(pages, cache_key=None, tier="quality"):
+    text = "".join(pages)
+    page_starts = list(itertools.accumulate((len(page) for page in pages[:-1]), initial=0))
+    tokenizer = summarizer_tokenizer(tier)
+    with timed("chunking"):
+        spans = list(chunk_spans(text, tokenizer=tokenizer))
+    chunks = [text[start:end] for start, end in spans]
+    yield json.dumps({"event": "start", "chunks": len(chunks), "pages": len(pages), "tier": tier}) + "\n"
+
+    try:
+        summaries = [None] * len(chunks)
+        # Chunks finish in batch order, not document order, so every event carries its chunk index
+        for i, summary in iter_chunk_summaries(chunks, tier):
+            summaries[i] = summary
+            start, end = spans[i]
+            yield json.dumps({
+                "event": "chunk",
+                "index": i,
+                "pages": [page_at(page_starts, start), page_at(page_starts, end - 1)],
+                "summary": summary
+            }) + "\n"
+
+        summary = " ".join(summary for summary in summaries if summary is not None)
+        if not summary.strip():
+            yield json.dumps({"event": "error", "error": "Failed to summarize PDF: no chunk could be summarized"}) + "\n"
+            return
+        if cache_key is not None:
+            cache_summary(cache_key, summary, all_chunks_summarized(chunks, summaries))
+        yield json.dumps({"event": "done", "summary": summary}) + "\n"
+    except Exception as e:
+        logger.error("Error during streamed summarization: %s", e)
+        yield json.dumps({"event": "error", "error": f"Failed to process PDF: {e}"}) + "\n"
+
+@app.post("/upload_pdf_stream/")
+async def upload_pdf_stream(file: UploadFile = File(...), tier: Optional[str] = None):
+    try:
+        with timed("upload_read"):
+            pdf_bytes = await file.read()
+        logger.info("Streaming upload received: %d bytes", len(pdf_bytes))
+        tier, cache_key, cached = await run_in_threadpool(resolve_summary_tier, pdf_bytes, tier)
+        if cached is not None:
+            event = json.dumps({"event": "done", "summary": cached["summary"], "cached": True, "tier": tier}) + "\n"
+            return StreamingResponse(iter([event]), media_type="application/x-ndjson")
+
+        pages = await inference_pool.run(extract_pages, pdf_bytes)
 
-        os.remove(temp_path)
+        if not "".join(pages).strip():
+            return {"error": "No text found in PDF"}
 
-        return {"summary": summary}
+        # Hold one pool slot for the whole stream, each chunk batch runs on a pool worker.
+        # The background task frees it if the client is gone before the stream starts
+        slot = inference_pool.hold()
+        events = inference_pool.iterate(stream_summary_events(pages, cache_key, tier), slot)
+        return StreamingResponse(events, media_type="application/x-ndjson",
+                                 background=BackgroundTask(slot.release_unstarted))
+    except PoolFullError:
+        raise
     except Exception as e:
-        print(f"Error during processing: {e}")
+        logger.error("Error during processing: %s", e)
         return {"error": f"Failed to process PDF: {e}"}
 
 class MCQRequest(BaseModel):
     paragraph: str
     num_questions: int = 5
+    session_id: Optional[str] = None
+    tier: Optional[str] = None
+    # Also return each MCQ in the "Question:/A)/Correct Answer:" text layout
+    include_text: bool = False
+
+# Every valid MCQ is kept per paragraph, so repeat quizzes only generate what the pool lacks
+mcq_pool = MCQPool(
+    max_paragraphs=int(os.environ.get("MCQ_POOL_PARAGRAPHS", "256")),
+    max_per_paragraph=int(os.environ.get("MCQ_POOL_PER_PARAGRAPH", "50"))
+)
+
+# Used questions/answers are tracked per session, or per paragraph when no session is given
+dedup_store = DedupStore(
+    max_scopes=int(os.environ.get("DEDUP_MAX_SCOPES", "1024")),
+    ttl=int(os.environ.get("DEDUP_TTL_SECONDS", "3600")),
+    max_items=int(os.environ.get("DEDUP_MAX_ITEMS", "500"))
+)
+
+# Generation rounds are sized from the yield seen on similar paragraphs, and each request
+# samples at most MCQ_DECODE_BUDGET candidate questions in total
+yield_controller = YieldController(
+    initial_yield=float(os.environ.get("MCQ_INITIAL_YIELD", "0.5")),
+    max_round=int(os.environ.get("MCQ_BATCH_MAX_SIZE", "64"))
+)
+mcq_decode_budget = int(os.environ.get("MCQ_DECODE_BUDGET", "96"))
+
+# Function to generate the MCQs for one request, runs on the inference pool
+def build_mcqs(request, pool_key, tier="quality"):
+    paragraph = request.paragraph
+    shortfall = request.num_questions - mcq_pool.size(pool_key)
+    if shortfall <= 0:
+        return mcq_pool.sample(pool_key, request.num_questions)
+
+    logger.info("Generating %d MCQs for a paragraph of %d characters", shortfall, len(paragraph))
+
+    dedup = dedup_store.scope(request.session_id or pool_key)
+    # Pooled MCQs count as used, or the shortfall could regenerate them and the pool would drop them
+    for mcq in mcq_pool.mcqs(pool_key):
+        dedup.add(mcq["question"], mcq["correct_answer"])
+    # MCQs come back as objects with four options each, so nothing is lost to parsing
+    mcqs = generate_multiple_mcqs(paragraph, num_questions=shortfall, dedup=dedup, tier=tier, structured=True,
+                                  yield_controller=yield_controller, decode_budget=mcq_decode_budget)
+    logger.info("Generated %d/%d MCQs", len(mcqs), shortfall)
+
+    mcq_pool.add(pool_key, [mcq.to_dict() for mcq in mcqs])
+    return mcq_pool.sample(pool_key, request.num_questions)
+
+# Function to add the text export to each MCQ when a request asks for it
+def export_mcqs(mcqs, include_text=False):
+    if not include_text:
+        return mcqs
+    return [{**mcq, "text": MCQ.from_dict(mcq).to_text()} for mcq in mcqs]
 
 @app.post("/generate_mcqs/")
 async def generate_mcqs(request: MCQRequest):
     try:
-        paragraph = request.paragraph
-        num_questions = request.num_questions * 2  
-        print(f"Received paragraph: {paragraph}")
-        print(f"Number of MCQs requested: {num_questions}")
-
-        raw_mcqs = generate_multiple_mcqs(paragraph, num_questions=num_questions)
-        mcqs = [parse_mcqs(mcq) for mcq in raw_mcqs]
-        valid_mcqs = [mcq for mcq in mcqs if mcq and len(mcq["options"]) >= 4]
-        
-        print(f"Generated {len(valid_mcqs)} valid MCQs from {len(raw_mcqs)} raw")
-        
-        if len(valid_mcqs) < request.num_questions:
-            additional_needed = request.num_questions - len(valid_mcqs)
-            print(f"Need {additional_needed} more MCQs. Generating...")
-            additional_raw = generate_multiple_mcqs(paragraph, num_questions=additional_needed*3)
-            additional_mcqs = [parse_mcqs_alternative(mcq) for mcq in additional_raw]
-            additional_valid = [mcq for mcq in additional_mcqs if mcq and len(mcq["options"]) >= 4]
-            valid_mcqs.extend(additional_valid)
-        
-        return {"mcqs": valid_mcqs[:request.num_questions]}
+        tier = requested_tier(request.tier, mcq_model_paths)
+        pool_key = MCQPool.make_key(request.paragraph, mcq_model_paths[tier])
+        if mcq_pool.size(pool_key) >= request.num_questions:
+            mcqs = mcq_pool.sample(pool_key, request.num_questions)
+            return {"mcqs": export_mcqs(mcqs, request.include_text), "tier": tier}
+
+        # Generation is needed, so a deep queue moves the request to the fast tier
+        served_tier = downgrade_tier("mcq", tier, mcq_model_paths, inference_pool.depth)
+        if served_tier != tier:
+            tier = served_tier
+            pool_key = MCQPool.make_key(request.paragraph, mcq_model_paths[tier])
+
+        mcqs = await inference_pool.run(build_mcqs, request, pool_key, tier)
+        return {"mcqs": export_mcqs(mcqs, request.include_text), "tier": tier}
+    except PoolFullError:
+        raise
     except Exception as e:
-        print(f"Exception in generate_mcqs: {str(e)}")
+        logger.error("Exception in generate_mcqs: %s", e)
         return {"error": f"Failed to generate MCQs: {e}"}
 
 def parse_mcqs(raw_mcq: str):
@@ -198,5 +639,5 @@ def parse_mcqs_alternative(raw_mcq: str):
             "correct_answer": correct_answer
         }
     except Exception as e:
-        print(f"Error in parse_mcqs_alternative: {str(e)}")
+        logger.warning("Error in parse_mcqs_alternative: %s", e)
         return None
\ No newline at end of file
@@ -0,0 +1,25 @@
+import pytest
+from backend.models.keyword_index import KeywordIndex
+
+
+index = KeywordIndex(["WHO", "UN", "DNA", "Darwin", "evaporation", "water"])
+
+# Answers whose ordinary words spell an acronym key in lower case, none of them may pick it
+plain_answers = [
+    "the scientist who discovered gravity",
+    "un treaty",
+    "dna is copied before division",
+]
+
+
+@pytest.mark.parametrize("answer", plain_answers)
+def test_acronyms_need_their_case(answer):
+    assert index.best_match(answer) is None
+
+def test_acronyms_match_as_written():
+    assert index.best_match("The WHO sets health guidelines") == "WHO"
+    assert index.best_match("Resolutions of the UN") == "UN"
+
+def test_other_keys_ignore_case():
+    assert index.best_match("darwin's theory") == "Darwin"
+    assert index.best_match("Evaporation of sea water") == "evaporation"
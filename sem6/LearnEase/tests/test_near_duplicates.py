@@ -0,0 +1,40 @@
+import pytest
+from backend.models.dedup import DedupScope
+
+
+# Different questions generated from the same paragraph, they must all be usable together
+near_misses = [
+    ("What is the main source of energy?", "What is the main source of water?"),
+    ("How does water change into water vapor?", "How does water vapor change into liquid water?"),
+    ("What does the moon orbit around the earth?", "What does the earth orbit around the sun?"),
+    ("What is the main source of energy in the water cycle?", "What is the main source of heat in the water cycle?"),
+    ("Which gas do plants take in?", "Which gas do plants give off?"),
+]
+
+# The same question written differently, the second one must be rejected
+rewrites = [
+    ("What is the main source of energy?", "what is the main source of energy"),
+    ("What is the main source of energy that drives the water cycle?",
+     "What is the main source of energy that drives the water cycle today?"),
+]
+
+
+@pytest.mark.parametrize("first, second", near_misses)
+def test_near_miss_questions_are_kept(first, second):
+    scope = DedupScope()
+    assert scope.add(first, "answer one")
+    assert not scope.has_question(second)
+    assert scope.add(second, "answer two")
+
+@pytest.mark.parametrize("first, second", rewrites)
+def test_rewritten_questions_are_rejected(first, second):
+    scope = DedupScope()
+    assert scope.add(first, "answer one")
+    assert scope.has_question(second)
+    assert not scope.add(second, "answer two")
+
+@pytest.mark.parametrize("first, second", [("carbon dioxide", "carbon monoxide"), ("the moon", "the sun")])
+def test_different_answers_are_kept(first, second):
+    scope = DedupScope()
+    assert scope.add("Which gas do plants take in?", first)
+    assert not scope.answer_conflicts(second)